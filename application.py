@@ -3,54 +3,82 @@
 import os
 import json
 from random import randint
-import math
-import numpy as np
 import dash
 import dash_table
 import flask
-from dash.dependencies import Input, Output, State
-import plotly.graph_objs as go
+import numpy as np
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_core_components as dcc
 import dash_html_components as html
+import plotly
+
+import export
+import httpcache
+from metrics import Instrumentation
 
-import pandas as pd
-import geopandas as gpd
+from dataset import DatasetManager
+from resultcache import ResultCache, selection_key
+from scoring import level_names
+from spatial import viewport_bounds
+from store import hazard_lu, normalize_selection, table_columns
+from timeseries import LatestStore
 
 server = flask.Flask(__name__)
+# Dash wraps the server in Flask-Compress (gzip only in the pinned 1.4)
+server.config.setdefault('COMPRESS_LEVEL', 6)
+server.config.setdefault('COMPRESS_MIN_SIZE', 500)
 mapbox_access_token = os.environ['MAPBOX_ACCESS_TOKEN']
-communities = pd.read_csv('Data.csv')
-names = communities['Community']
 path_prefix='./'
 server.secret_key = os.environ.get('secret_key', str(randint(0, 1000000)))
 app = dash.Dash(__name__, server=server)
+metrics = Instrumentation(
+    enabled=os.environ.get('METRICS_ENABLED') == '1',
+    server_timing=os.environ.get('SERVER_TIMING') == '1'
+)
+
+def community_selector(names):
+    return html.Div(
+        className='field',
+        children=[
+            html.Label('Type the name of one or more communities in the box below to get started.'),
+            html.Div(
+                className='control',
+                children=[
+                    dcc.Dropdown(
+                        id='community',
+                        options=[{'label':name, 'value':name} for name in names],
+                        value='Shishmaref',
+                        multi=True
+                    )
+                ]
+            )
+        ]
+    )
 
-def calc_rolling_mean(array, ndays, location):
-    annual_rolling_pcpt = []
-    annual_rolling_mean = []
-    rolling_pcpt = []
-    for i, (index,row) in enumerate(df.iterrows()):
-        rolling_pcpt.append(row[location])
-        if len(rolling_pcpt) > (ndays):
-            rolling_pcpt.pop(0)
-        annual_rolling_mean = np.mean(rolling_pcpt)
-        annual_rolling_pcpt = np.sum(rolling_pcpt)
-    return {'pcpt': annual_rolling_pcpt, 'mean': annual_rolling_mean}
-
-community = html.Div(
+similar_selector = html.Div(
     className='field',
     children=[
-        html.Label('Type the name of one or more communities in the box below to get started.'),
+        html.Label('Add the communities most like the first one selected, by hazard ranks and location.'),
         html.Div(
-            className='control',
+            className='field has-addons',
             children=[
-                dcc.Dropdown(
-                    id='community',
-                    options=[{'label':name, 'value':name} for name in names],
-                    value='Shishmaref',
-                    multi=True
+                html.Div(
+                    className='control',
+                    children=[
+                        dcc.Input(id='similar-count', className='input', type='number', value=5, min=1, max=20)
+                    ]
+                ),
+                html.Div(
+                    className='control',
+                    children=[
+                        html.Button('Add similar communities', id='similar-button', className='button')
+                    ]
                 )
             ]
-        )
+        ),
+        # Written by add_similar_communities, read by the clientside map.select
+        dcc.Store(id='similar-selection')
     ]
 )
 
@@ -78,50 +106,164 @@ risklevel = html.Div(
     ]
 )
 
-risk_level = communities['Risk Level']
-risk_color = []
-for i in risk_level:
-    if i == 'High':
-        risk_color.append('#8d2520')
-    if i == 'Medium':
-        risk_color.append('#F2CC50')
-    if i == 'Low':
-        risk_color.append('#476220')
-    if i == 'None':
-        risk_color.append('#808080')
-
-communities['Hover Title'] = communities[['Community', 'Risk Level']].apply(lambda x: ': '.join(x), axis=1)
-
-map_communities_trace = go.Scattermapbox(
-    lat=communities['Latitude'],
-    lon=communities['Longitude'],
-    mode='markers',
-    marker={
-        'size': 15,
-        'color': risk_color
+color_lu = {
+    'Risk Level': {
+        'None': '#808080',
+        'Low': '#476220',
+        'Medium': '#F2CC50',
+        'High': '#8d2520'
     },
-    text=communities['Hover Title'],
-    hoverinfo='text'
-)
+    'Massive Ice': {
+        'None': '#808080',
+        'Low': '#406080',
+        'Medium': '#4080c0',
+        'High': '#40a0f0'
+    },
+    'Thaw Susceptibility': {
+        'None': '#808080',
+        'Low': '#406080',
+        'Medium': '#4080c0',
+        'High': '#40a0f0'
+    },
+    'Existing Problems': {
+        'None': '#808080',
+        'Low': '#406080',
+        'Medium': '#4080c0',
+        'High': '#40a0f0'
+    },
+    'Permafrost Occurrence': {
+        'None': '#808080',
+        'Low': '#406080',
+        'Medium': '#4080c0',
+        'High': '#40a0f0'
+    },
+    'Permafrost Temperature': {
+        'None': '#808080',
+        'Low': '#406080',
+        'Medium': '#4080c0',
+        'High': '#40a0f0'
+    }
+}
 
-map_layout = go.Layout(
-    height=400,
-    autosize=True,
-    hovermode='closest',
-    mapbox=dict(
-        accesstoken=mapbox_access_token,
-        zoom=3,
-        center=dict(lat=65, lon=-152),
-        style="light",
-    ),
-    showlegend=False,
-    margin=dict(l=0, r=0, t=0, b=0)
-)
+map_layout = {
+    'height': 400,
+    'autosize': True,
+    'hovermode': 'closest',
+    'mapbox': {
+        'accesstoken': mapbox_access_token,
+        'zoom': 3,
+        'center': {'lat': 65, 'lon': -152},
+        'style': 'light'
+    },
+    'showlegend': False,
+    'margin': {'l': 0, 'r': 0, 't': 0, 'b': 0},
+    # Keep the user's pan/zoom when the figure is replaced
+    'uirevision': 'map'
+}
 
-map_figure = go.Figure({
-    'data': [map_communities_trace],
-    'layout': map_layout
-})
+# Up to this many communities the map runs in the browser (assets/map.js);
+# above it the server sends the viewport, clustered when zoomed out
+map_max_points = 2000
+map_cluster_zoom = 8
+
+def level_colorscale(palette):
+    """ Stepped colorscale so markers can carry 0-3 codes instead of a hex string each. """
+    colors = [palette[name] for name in level_names]
+    return [
+        [0, colors[0]], [1 / 6.0, colors[0]],
+        [1 / 6.0, colors[1]], [0.5, colors[1]],
+        [0.5, colors[2]], [5 / 6.0, colors[2]],
+        [5 / 6.0, colors[3]], [1, colors[3]]
+    ]
+
+def map_trace(store, risktype, positions):
+    """ One marker per community at `positions`; customdata carries the name for clicks. """
+    return {
+        'type': 'scattermapbox',
+        # ~1 m precision is plenty for community markers
+        'lat': store.latitude[positions].round(5).tolist(),
+        'lon': store.longitude[positions].round(5).tolist(),
+        'customdata': store.columns['Community'][positions].tolist(),
+        'mode': 'markers',
+        'marker': {
+            'size': 15,
+            'color': store.category_codes(risktype)[positions].tolist(),
+            'colorscale': level_colorscale(color_lu[risktype]),
+            'cmin': 0,
+            'cmax': 3
+        },
+        'text': store.category_labels(risktype)[positions].tolist(),
+        'hoverinfo': 'text'
+    }
+
+def cluster_trace(store, risktype, positions, zoom):
+    """ One marker per ~64px grid cell, colored by the highest level inside it. """
+    inverse, counts, lat, lon = store.spatial.clusters(positions, 45.0 / 2 ** zoom)
+    codes = np.zeros(len(counts), dtype=int)
+    np.maximum.at(codes, inverse, store.category_codes(risktype)[positions])
+    return {
+        'type': 'scattermapbox',
+        'lat': lat.round(5).tolist(),
+        'lon': lon.round(5).tolist(),
+        'customdata': [None] * len(counts),
+        'mode': 'markers',
+        'marker': {
+            'size': (15 + 5 * np.log2(counts)).round(1).tolist(),
+            'color': codes.tolist(),
+            'colorscale': level_colorscale(color_lu[risktype]),
+            'cmin': 0,
+            'cmax': 3
+        },
+        'text': ['{} communities, highest: {}'.format(count, level_names[code]) for count, code in zip(counts, codes)],
+        'hoverinfo': 'text'
+    }
+
+def map_figure_for(store, risktype, positions, zoom):
+    if len(positions) > map_max_points and zoom < map_cluster_zoom:
+        trace = cluster_trace(store, risktype, positions, zoom)
+    else:
+        trace = map_trace(store, risktype, positions)
+    return {
+        'data': [trace],
+        'layout': map_layout
+    }
+
+def map_view(relayout):
+    """ ((south, west, north, east), zoom) from the map's relayoutData, or None before it has moved. """
+    if not relayout or 'mapbox.zoom' not in relayout:
+        return None
+    zoom = relayout['mapbox.zoom']
+    if 'mapbox._derived' in relayout:
+        corners = relayout['mapbox._derived']['coordinates']
+        lats = [corner[1] for corner in corners]
+        bounds = (min(lats), corners[0][0], max(lats), corners[1][0])
+    elif 'mapbox.center' in relayout:
+        bounds = viewport_bounds(relayout['mapbox.center'], zoom, height=map_layout['height'])
+    else:
+        return None
+    # Pad so markers just outside the edge are already there when panning
+    south, west, north, east = bounds
+    pad_lat, pad_lon = (north - south) / 4.0, (east - west) / 4.0
+    return (south - pad_lat, west - pad_lon, north + pad_lat, east + pad_lon), zoom
+
+def map_data(store):
+    """ Coordinates, names and per-category codes/labels for the clientside map callbacks in assets/map.js. """
+    categories = {}
+    for risktype in color_lu:
+        labels, label_codes = store.category_label_codes(risktype)
+        categories[risktype] = {
+            'codes': store.category_codes(risktype).tolist(),
+            'labels': labels.tolist(),
+            'label_codes': label_codes.tolist(),
+            'colorscale': level_colorscale(color_lu[risktype])
+        }
+    return {
+        'names': store.columns['Community'].tolist(),
+        'lat': store.latitude.round(5).tolist(),
+        'lon': store.longitude.round(5).tolist(),
+        'categories': categories,
+        'layout': map_layout
+    }
 
 
 config = {
@@ -134,13 +276,63 @@ config = {
     }
 }
 
-table_columns = [{'name': 'Community', 'id': 'Community'}, {'name': 'Confidence', 'id': 'Confidence'}, {'name': 'Permafrost Occurrence', 'id': 'Permafrost Occurrence Label'}, {'name': 'Permafrost Temperature', 'id': 'Permafrost Temperature Label'}, {'name': 'Thaw Susceptibility', 'id': 'Thaw Susceptibility Label'}, {'name': 'Massive Ice', 'id': 'Massive Ice Label'}, {'name': 'Existing Problems', 'id': 'Eexisting Problems Label'}, {'name': 'Rating Score', 'id': 'Rating Score'}, {'name': 'Risk Level', 'id': 'Risk Level'}]
 
-data_table = dash_table.DataTable(
-    id='community-table',
-    columns=table_columns,
-    data=communities.to_dict('records')
-)
+table_page_size = 20
+
+# Optional daily climate series (see timeseries.write_timeseries)
+climate_dir = os.environ.get('TIMESERIES_DIR')
+climate = LatestStore(climate_dir) if climate_dir else None
+climate_max_points = 1000
+climate_max_traces = 10
+
+def climate_section(climate):
+    variables = sorted(climate.variables)
+    return html.Div(
+        className='column',
+        children=[
+            html.Div(
+                className='field',
+                children=[
+                    html.Label('Climate variable'),
+                    dcc.Dropdown(
+                        id='climate-variable',
+                        options=[{'label': variable, 'value': variable} for variable in variables],
+                        value=variables[0],
+                        clearable=False
+                    ),
+                    dcc.RadioItems(
+                        id='climate-freq',
+                        options=[
+                            {'label': 'Daily', 'value': 'D'},
+                            {'label': 'Monthly', 'value': 'M'},
+                            {'label': 'Annual', 'value': 'A'}
+                        ],
+                        value='A'
+                    )
+                ]
+            ),
+            dcc.Graph(
+                id='climate-plot',
+                config=config
+            )
+        ]
+    )
+
+def community_table(records):
+    # Paging, filtering and sorting happen in update_graph ('be' mode),
+    # so the browser only ever holds the visible page.
+    return dash_table.DataTable(
+        id='community-table',
+        columns=table_columns,
+        data=records,
+        pagination_mode='be',
+        pagination_settings={'current_page': 0, 'page_size': table_page_size},
+        filtering='be',
+        filter='',
+        sorting='be',
+        sorting_type='multi',
+        sort_by=[]
+    )
 
 header_section = html.Div(
     className='header',
@@ -246,208 +438,233 @@ help_text = html.Div(
     ]
 )
 
-app.layout = html.Div(
-    children=[
-        header_section,
-        html.Div(
-            className='section',
-            children=[
-                html.Div(
-                    className='container',
-                    children=[
-                        html.Div(
-                            className='columns',
-                            children=[
-                                html.Div(
-                                    className='column',
-                                    children=[
-                                        html.Div(
-                                            className='column',
-                                            children=[
-                                                html.H2('Community Risk Data & Selection')
-                                            ]
-                                        ),
-                                        html.Div(
-                                            className='column',
-                                            children=[
-                                                html.Div('Explore permafrost risks and hazards for rural communities in Alaska based on massive ice, thaw sysceptibility, existing infrastructure probelms, permafrost occurence and temperature.  These are tallied to create a cumulative rating score and risk level.')
-                                            ]
-                                        ),
-                                        html.Div(
-                                            className='column',
-                                            children=[
-                                                risklevel
-                                            ]
-                                        ),
-                                        html.Div(
-                                            className='column',
-                                            children=[
-                                                community
-                                            ]
-                                        )
-                                    ]
-                                ),
-                                html.Div(
-                                    className='column',
-                                    children=[
-                                        dcc.Graph(
-                                            id='map',
-                                            figure=map_figure,
-                                            config={
-                                                'displayModeBar': 'hover',
-                                                'scrollZoom': True,
-                                                'modeBarButtonsToRemove': ["pan2d", "lasso2d", "toImage", "toggleHover", "select2d"]
-                                            }
-                                        )
-                                    ]
-                                ),
+def build_layout(store, map_figure):
+    # Every point inlined in the layout only while that stays small
+    map_points = map_data(store) if len(store) <= map_max_points else None
+    return html.Div(
+        children=[
+            header_section,
+            html.Div(
+                className='section',
+                children=[
+                    html.Div(
+                        className='container',
+                        children=[
+                            html.Div(
+                                className='columns',
+                                children=[
+                                    html.Div(
+                                        className='column',
+                                        children=[
+                                            html.Div(
+                                                className='column',
+                                                children=[
+                                                    html.H2('Community Risk Data & Selection')
+                                                ]
+                                            ),
+                                            html.Div(
+                                                className='column',
+                                                children=[
+                                                    html.Div('Explore permafrost risks and hazards for rural communities in Alaska based on massive ice, thaw sysceptibility, existing infrastructure probelms, permafrost occurence and temperature.  These are tallied to create a cumulative rating score and risk level.')
+                                                ]
+                                            ),
+                                            html.Div(
+                                                className='column',
+                                                children=[
+                                                    risklevel
+                                                ]
+                                            ),
+                                            html.Div(
+                                                className='column',
+                                                children=[
+                                                    community_selector(store.names),
+                                                    similar_selector
+                                                ]
+                                            )
+                                        ]
+                                    ),
+                                    html.Div(
+                                        className='column',
+                                        children=[
+                                            dcc.Store(id='map-data', data=map_points),
+                                            dcc.Graph(
+                                                id='map',
+                                                figure=map_figure,
+                                                config={
+                                                    'displayModeBar': 'hover',
+                                                    'scrollZoom': True,
+                                                    'modeBarButtonsToRemove': ["pan2d", "lasso2d", "toImage", "toggleHover", "select2d"]
+                                                }
+                                            )
+                                        ]
+                                    ),
+
+                                ]
+                            ),
+                            html.Div(
+                                className='column',
+                                children=[
+                                    dcc.Graph(
+                                        id='weather-plot',
+                                        config=config
+                                    )
+                                ]
+                            )
+                        ] + ([climate_section(climate.current())] if climate is not None else []) + [
+                            community_table(store.table_page('Shishmaref', 0, table_page_size))
+                        ]
+                    ),
+                    help_text
+                ]
+            ),
+            footer
+        ]
+    )
 
-                            ]
-                        ),
-                        html.Div(
-                            className='column',
-                            children=[
-                                dcc.Graph(
-                                    id='weather-plot',
-                                    config=config
-                                )
-                            ]
-                        ),
-                        data_table
-                    ]
-                ),
-                help_text
-            ]
-        ),
-        footer
-    ]
+def build_derived(store):
+    """ Everything served from a dataset version, rebuilt off the request path. """
+    positions = np.arange(len(store))
+    zoom = map_layout['mapbox']['zoom']
+    # Small datasets only need the first paint; assets/map.js builds the rest
+    risktypes = list(color_lu) if len(store) > map_max_points else ['Risk Level']
+    map_figures = {risktype: map_figure_for(store, risktype, positions, zoom) for risktype in risktypes}
+    layout = build_layout(store, map_figures['Risk Level'])
+    layout_json = json.dumps(layout, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+    return {
+        'map_figures': map_figures,
+        'layout': layout,
+        'layout_json': layout_json,
+        'layout_encoded': httpcache.precompress(layout_json),
+        'layout_etag': httpcache.content_etag(layout_json)
+    }
+
+dataset = DatasetManager(
+    'Data.csv',
+    build_derived,
+    interval=float(os.environ.get('DATASET_POLL_INTERVAL', 30))
 )
 
-color_lu = {
-    'Risk Level': {
-        'None': '#808080',
-        'Low': '#476220',
-        'Medium': '#F2CC50',
-        'High': '#8d2520'
-    },
-    'Massive Ice': {
-        'None': '#808080',
-        'Low': '#406080',
-        'Medium': '#4080c0',
-        'High': '#40a0f0'
-    },
-    'Thaw Susceptibility': {
-        'None': '#808080',
-        'Low': '#406080',
-        'Medium': '#4080c0',
-        'High': '#40a0f0'
-    },
-    'Existing Problems': {
-        'None': '#808080',
-        'Low': '#406080',
-        'Medium': '#4080c0',
-        'High': '#40a0f0'
-    },
-    'Permafrost Occurrence': {
-        'None': '#808080',
-        'Low': '#406080',
-        'Medium': '#4080c0',
-        'High': '#40a0f0'
-    },
-    'Permafrost Temperature': {
-        'None': '#808080',
-        'Low': '#406080',
-        'Medium': '#4080c0',
-        'High': '#40a0f0'
-    }
-}
+results = ResultCache(
+    lambda: dataset.current.version,
+    maxsize=int(os.environ.get('RESULT_CACHE_SIZE', 256)),
+    directory=os.environ.get('RESULT_CACHE_DIR'),
+    shared_maxsize=int(os.environ.get('RESULT_CACHE_FILES', 1024)),
+    metrics=metrics
+)
 
-@app.callback(
-    Output('map', 'figure'),
+@server.before_first_request
+def start_dataset_watcher():
+    # Threads do not survive gunicorn's fork, so each worker starts its own
+    dataset.start()
+
+def serve_layout():
+    return dataset.current.derived['layout']
+
+app.layout = serve_layout
+
+def serve_layout_json():
+    # Serialized and compressed once per dataset version in build_derived
+    derived = dataset.current.derived
+    return httpcache.conditional_response(derived['layout_json'], derived['layout_etag'], encoded=derived['layout_encoded'])
+
+server.view_functions[app.config['routes_pathname_prefix'] + '_dash-layout'] = serve_layout_json
+httpcache.cache_dependencies(app)
+httpcache.AssetCache(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets'))
+export.install(app, lambda: dataset.current)
+
+# Dash allows one callback per output, so the map mode is fixed when the app
+# starts; a reload that crosses map_max_points takes effect on restart.
+if len(dataset.current.store) <= map_max_points:
+    # Recoloring and click selection run in the browser
+    app.clientside_callback(
+        ClientsideFunction('map', 'figure'),
+        Output('map', 'figure'),
+        [
+            Input('risklevel', 'value'),
+            Input('map-data', 'data')
+        ],
+        [
+            State('map', 'figure')
+        ]
+    )
+else:
+    @app.callback(
+        Output('map', 'figure'),
+        [
+            Input('risklevel', 'value'),
+            Input('map', 'relayoutData')
+        ]
+    )
+    @metrics.timed
+    def update_map_view(risktype, relayout):
+        """ Full-extent figure until the map moves, then only the communities in (or near) the viewport. """
+        snapshot = dataset.current
+        store = snapshot.store
+        if risktype not in color_lu:
+            risktype = 'Risk Level'
+        view = map_view(relayout)
+        if view is None:
+            map_figures = snapshot.derived['map_figures']
+            if risktype in map_figures:
+                return map_figures[risktype]
+            # Only built up front for datasets over map_max_points
+            return map_figure_for(store, risktype, np.arange(len(store)), map_layout['mapbox']['zoom'])
+        bounds, zoom = view
+        return map_figure_for(store, risktype, store.spatial.bbox(*bounds), zoom)
+
+app.clientside_callback(
+    ClientsideFunction('map', 'select'),
+    Output('community', 'value'),
+    [
+        Input('map', 'clickData'),
+        Input('similar-selection', 'data')
+    ],
     [
-        Input('risklevel', 'value')
+        State('community', 'value')
     ]
 )
 
-def update_map_colors(risktype):
-    risk_level = communities[risktype]
-    risk_color = []
-    if (risktype  == 'Risk Level'):
-        newcomm_labels = communities[['Community', 'Risk Level']].apply(lambda x: ': '.join(x), axis=1)
-        for i in risk_level:
-            if i == 'None':
-                risk_color.append(color_lu[risktype]['None'])
-            if i == 'Low':
-                risk_color.append(color_lu[risktype]['Low'])
-            if i == 'Medium':
-                risk_color.append(color_lu[risktype]['Medium'])
-            if i == 'High':
-                risk_color.append(color_lu[risktype]['High'])
-    else:
-        newcomm_labels = communities[['Community', risktype + ' Label']].apply(lambda x: ': '.join(x), axis=1)
-        for i in risk_level:
-            if i == 0:
-                risk_color.append(color_lu[risktype]['None'])
-            if i == 1:
-                risk_color.append(color_lu[risktype]['Low'])
-            if i == 2:
-                risk_color.append(color_lu[risktype]['Medium'])
-            if i == 3:
-                risk_color.append(color_lu[risktype]['High'])
-
-
-    map_communities_trace = go.Scattermapbox(
-        lat=communities['Latitude'],
-        lon=communities['Longitude'],
-        mode='markers',
-        marker={
-            'size': 15,
-            'color': risk_color
-        },
-        text=newcomm_labels,
-        hoverinfo='text'
-    )
-    figure = {
-        'data': [map_communities_trace],
-        'layout': map_layout
-    }
-    return figure
-
 @app.callback(
-    Output('community', 'value'),
+    Output('similar-selection', 'data'),
+    [
+        Input('similar-button', 'n_clicks')
+    ],
     [
-        Input('map', 'clickData')
+        State('community', 'value'),
+        State('similar-count', 'value')
     ]
 )
-
-def update_mine_site_dropdown(selected_on_map):
-    """ If user clicks on the map, update the drop down. """
-    if selected_on_map is not None:
-        # Return community name
-        comm_val =  selected_on_map['points'][0]['text'].split(':')[0]
-        return comm_val
-    # Return a default
-    return 'Shishmaref'
-
+@metrics.timed
+def add_similar_communities(n_clicks, community, count):
+    """ The first selected community followed by its nearest neighbours. """
+    selection = normalize_selection(community)
+    if not n_clicks or not selection:
+        raise PreventUpdate
+    similar = dataset.current.store.similar(selection[0], min(max(int(count or 5), 1), 20))
+    # n_clicks makes every press a new value, even for the same selection
+    return {'selection': selection[:1] + similar, 'clicks': n_clicks}
 
 @app.callback(
     [Output('community-table', 'data')],
     inputs=[
-        Input('community', 'value')
+        Input('community', 'value'),
+        Input('community-table', 'pagination_settings'),
+        Input('community-table', 'filter'),
+        Input('community-table', 'sort_by')
     ]
 )
-
-def update_graph(community):
-    commarray = {}
-    if (type(community) == str):
-        commarray = communities[communities['Community'] == community]
-    else:
-        for i, obj in enumerate(community):
-            if i == 0:
-                commarray = communities[communities['Community'] == obj]
-            else:
-                commarray = pd.concat([commarray,communities[communities['Community'] == obj]])
-    return [commarray.to_dict('records')]
+@metrics.timed
+def update_graph(community, pagination_settings, filter_query, sort_by):
+    pagination_settings = pagination_settings or {}
+    return [dataset.current.store.table_page(
+        community,
+        pagination_settings.get('current_page', 0),
+        pagination_settings.get('page_size', table_page_size),
+        filter_query,
+        sort_by
+    )]
+
+webgl_threshold = 50
 
 @app.callback(
     Output('weather-plot', 'figure'),
@@ -455,48 +672,31 @@ def update_graph(community):
         Input('community', 'value')
     ]
 )
+@metrics.timed
 def make_plot(community):
     figure = {}
     figure['data'] = []
 
-    hazard_lu = ['Massive Ice', 'Thaw Susceptibility', 'Existing Problems', 'Permafrost Occurrence','Permafrost Temperature', 'Risk Level' ]
     mult = 200.0
     marker_colors = ['#1D94A5','#2A697D','#AC8B53','#2F798E','#7F9EA3', '#EA906D']
 
-
-
-
-    for i in community:
-        if type(community) == str: 
-            df = communities[communities['Community'] == community].iloc[0]
-        else:
-            df = communities[communities['Community'] == i].iloc[0]
-            
-        marker_texts = [df[10], df[9], df[11], df[7], df[8], df[13]]
-        marker_size_vals = [df[5], df[4], df[6], df[2], df[3], df[12]]
-
-        if marker_size_vals[5] == 0:
-            # Leave marker size if 0
-            marker_size_vals[5] = 0
-        else:
-            # Normalize Risk Score from 0 - 3 from None, 6-15
-            # 6-8 = Low, 9-12 = Medium, 13+ = High
-            marker_size_vals[5] = math.ceil((marker_size_vals[5] - 5) / 3)
-        marker_sizes = [x * 1.2 + 0.25 for x in marker_size_vals]
-
+    selected = dataset.current.store.plot_arrays(community)
+    count = len(selected['names'])
+    if count:
+        # One trace for the whole selection; WebGL once SVG gets slow to draw
         figure['data'].append({
-            'x': hazard_lu,
-            'y': [df['Community'], df['Community'], df['Community'], df['Community'], df['Community'], df['Community']],
-            'name': df['Community'],
+            'type': 'scattergl' if count > webgl_threshold else 'scatter',
+            'x': hazard_lu * count,
+            'y': [name for name in selected['names'] for _ in hazard_lu],
             'showlegend': False,
-            'hovertext': marker_texts,
-            'hovertemplate': "%{text}",
-            'text': marker_texts,
-            'textposition': 'center',
+            'hovertext': selected['texts'],
+            'hovertemplate': "%{text}<extra>%{y}</extra>",
+            'text': selected['texts'],
+            'textposition': 'middle center',
             'mode': 'markers+text',
             'marker': {
-                'color': marker_colors,
-                'size': marker_sizes,
+                'color': marker_colors * count,
+                'size': selected['sizes'],
                 'sizeref': 0.05,
                 'sizemode': 'scaled',
                 'opacity': 0.6
@@ -525,10 +725,8 @@ def make_plot(community):
         },
     })
     '''
-    plot_height = 500
-    #if (type(community) == list):
-        #print(len(community) * 100)
-        #plot_height = 100.0 * len(community)
+    # Keep each community's row readable as the selection grows
+    plot_height = max(500, 150 + 40 * count)
     layout = {
         'barmode': 'grouped',
         'hovermode': 'closest',
@@ -552,6 +750,60 @@ def make_plot(community):
     figure['layout'] = layout
     return figure
 
+def climate_range(relayout):
+    """ (start, end) of the zoomed x axis, or (None, None) for the whole record. """
+    relayout = relayout or {}
+    if 'xaxis.range[0]' in relayout:
+        return relayout['xaxis.range[0]'][:10], relayout['xaxis.range[1]'][:10]
+    if 'xaxis.range' in relayout:
+        return relayout['xaxis.range'][0][:10], relayout['xaxis.range'][1][:10]
+    return None, None
+
+if climate is not None:
+    @app.callback(
+        Output('climate-plot', 'figure'),
+        inputs=[
+            Input('community', 'value'),
+            Input('climate-variable', 'value'),
+            Input('climate-freq', 'value'),
+            Input('climate-plot', 'relayoutData')
+        ]
+    )
+    @metrics.timed
+    def make_climate_plot(community, variable, freq, relayout):
+        """ One line per selected community; zooming in re-queries that range at full detail. """
+        start, end = climate_range(relayout)
+        store = climate.current()
+        traces = []
+        for name in normalize_selection(community)[:climate_max_traces]:
+            # A reimport may have dropped the community or the variable
+            if name not in store or variable not in store.variables:
+                continue
+            dates, values = store.series(name, variable, start, end, freq, climate_max_points)
+            traces.append({
+                'type': 'scattergl',
+                'mode': 'lines',
+                'name': name,
+                'x': np.datetime_as_string(dates).tolist(),
+                'y': values.round(2).tolist()
+            })
+        return {
+            'data': traces,
+            'layout': {
+                'height': 400,
+                'yaxis': {'title': variable},
+                'margin': {'t': 20},
+                # Keep the user's zoom while the data underneath is re-queried
+                'uirevision': '{} {}'.format(variable, freq)
+            }
+        }
+
+results.install(app, {
+    'update_graph': lambda community, *table: [selection_key(community)] + list(table),
+    'make_plot': selection_key
+})
+metrics.install(app)
+
 if __name__ == '__main__':
     app.server.run(debug=True, threaded=True)
     #app.run_server(debug=True)
@@ -0,0 +1,74 @@
+/*
+ * Clientside callbacks for the community map. Up to map_max_points
+ * communities, the layout carries a `map-data` dcc.Store (see map_data in
+ * application.py) and every marker is always drawn, so switching categories
+ * and clicking never go back to the server. Larger datasets get their
+ * viewport from the server instead (update_map_view).
+ */
+(function () {
+    var figures = {data: null, byCategory: {}};
+
+    function pick(values, positions) {
+        return positions.map(function (i) { return values[i]; });
+    }
+
+    function markerTrace(data, category, positions) {
+        return {
+            type: 'scattermapbox',
+            lat: pick(data.lat, positions),
+            lon: pick(data.lon, positions),
+            customdata: pick(data.names, positions),
+            mode: 'markers',
+            marker: {size: 15, color: pick(category.codes, positions), colorscale: category.colorscale, cmin: 0, cmax: 3},
+            text: positions.map(function (i) {
+                return data.names[i] + ': ' + category.labels[category.label_codes[i]];
+            }),
+            hoverinfo: 'text'
+        };
+    }
+
+    function figure(risktype, data, current) {
+        if (!data) {
+            // The dataset outgrew map_max_points after the app started
+            return current;
+        }
+        if (data !== figures.data) {
+            figures = {data: data, byCategory: {}};
+        }
+        var category = data.categories[risktype] ? risktype : 'Risk Level';
+        if (!figures.byCategory[category]) {
+            var all = [];
+            for (var i = 0; i < data.names.length; i++) {
+                all.push(i);
+            }
+            figures.byCategory[category] = {data: [markerTrace(data, data.categories[category], all)], layout: data.layout};
+        }
+        return figures.byCategory[category];
+    }
+
+    // Inputs seen by the last select call, to tell which one changed
+    var seen = {click: null, similar: null};
+
+    // Clicking a community selects it; clicking a cluster keeps the current
+    // selection. "Add similar communities" replaces it with the server's pick.
+    function select(clickData, similar, current) {
+        var clicked = clickData !== seen.click;
+        var picked = similar !== seen.similar;
+        seen = {click: clickData, similar: similar};
+        if (picked && similar && !clicked) {
+            return similar.selection;
+        }
+        if (!clickData || !clicked) {
+            return current;
+        }
+        var point = clickData.points[0];
+        if (point.customdata === undefined) {
+            return point.text.split(':')[0];
+        }
+        return point.customdata === null ? current : point.customdata;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        map: {figure: figure, select: select}
+    });
+}());
@@ -0,0 +1,145 @@
+""" In-process latency/throughput benchmark for the Dash callbacks.
+
+Requests go through the Flask test client, so routing, (de)serialization
+and compression are measured the same way gunicorn would run them.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_dataset(n, path, source='Data.csv', seed=0):
+    """ Write an `n` community CSV resampled from `source`, with unique names and jittered locations. """
+    rng = np.random.RandomState(seed)
+    communities = pd.read_csv(source, keep_default_na=False)
+    rows = communities.iloc[rng.randint(0, len(communities), n)].reset_index(drop=True)
+    rows['Community'] = ['{} {:06d}'.format(name, i) for i, name in enumerate(rows['Community'])]
+    rows['Latitude'] = rows['Latitude'] + rng.normal(0, 0.5, n)
+    rows['Longitude'] = rows['Longitude'] + rng.normal(0, 0.5, n)
+    rows.to_csv(path, index=False)
+    return path
+
+
+def percentile_ms(seconds, q):
+    return float(np.percentile(seconds, q)) * 1000.0
+
+
+class CallbackBench(object):
+    """ Drives callbacks by function name through `_dash-update-component`. """
+
+    def __init__(self, app, gzip=False):
+        self.app = app
+        self.client = app.server.test_client()
+        self.headers = {'Accept-Encoding': 'gzip'} if gzip else {}
+        self.outputs = {}
+        for output, callback in app.callback_map.items():
+            if 'callback' not in callback:
+                continue  # clientside
+            self.outputs[callback['callback'].__name__] = (output, callback['inputs'], callback['state'])
+
+    def payload(self, name, values):
+        output, inputs, state = self.outputs[name]
+        return {
+            'output': output,
+            'inputs': [dict(i, value=values.get(i['id'] + '.' + i['property'])) for i in inputs],
+            'state': [dict(s, value=values.get(s['id'] + '.' + s['property'])) for s in state]
+        }
+
+    def call(self, name, values):
+        response = self.client.post('/_dash-update-component', json=self.payload(name, values), headers=self.headers)
+        if response.status_code not in (200, 204):
+            raise RuntimeError('{} returned {}'.format(name, response.status_code))
+        return len(response.get_data())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        return len(response.get_data())
+
+    def measure(self, label, request, repeat):
+        request()  # warm up
+        timings = []
+        size = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            size = request()
+            timings.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+        return {
+            'scenario': label,
+            'requests': repeat,
+            'p50_ms': percentile_ms(timings, 50),
+            'p95_ms': percentile_ms(timings, 95),
+            'throughput_rps': repeat / elapsed,
+            'response_bytes': size
+        }
+
+
+def scenarios(bench, names):
+    """ (label, request) pairs covering every server callback with 1, 10 and all selected communities. """
+    table_defaults = {
+        'community-table.pagination_settings': {'current_page': 0, 'page_size': 20},
+        'community-table.filter': '',
+        'community-table.sort_by': []
+    }
+    yield 'layout', lambda: bench.get('/_dash-layout')
+    for size in (1, 10, len(names)):
+        selection = names[:size]
+        values = dict(table_defaults, **{'community.value': selection})
+        yield 'update_graph[{}]'.format(size), lambda values=values: bench.call('update_graph', values)
+        yield 'make_plot[{}]'.format(size), lambda selection=selection: bench.call('make_plot', {'community.value': selection})
+    if 'update_map_view' in bench.outputs:
+        # Only registered when the app started with more than map_max_points communities
+        view = {'mapbox.center': {'lat': 64.8, 'lon': -147.7}, 'mapbox.zoom': 5}
+        yield 'update_map_view', lambda: bench.call('update_map_view', {'risklevel.value': 'Risk Level', 'map.relayoutData': view})
+    similar = {'similar-button.n_clicks': 1, 'community.value': names[:1], 'similar-count.value': 20}
+    yield 'add_similar_communities[20]', lambda: bench.call('add_similar_communities', similar)
+
+
+def run(scale=None, repeat=50, gzip=False, result_cache=False):
+    """ Benchmark every scenario, optionally against a synthetic `scale`-community dataset.
+
+    Every scenario repeats one request, so the result cache is bypassed
+    unless `result_cache` asks for the cache-hit timings.
+    """
+    os.environ.setdefault('MAPBOX_ACCESS_TOKEN', 'benchmark')
+    os.environ.setdefault('DATASET_POLL_INTERVAL', '0')
+    import application
+    from dataset import DatasetManager
+
+    if scale:
+        path = synthetic_dataset(scale, os.path.join(tempfile.mkdtemp(), 'Data.csv'))
+        application.dataset = DatasetManager(path, application.build_derived, interval=0)
+    store = application.dataset.current.store
+    application.results.enabled = result_cache
+    bench = CallbackBench(application.app, gzip=gzip)
+    return [bench.measure(label, request, repeat) for label, request in scenarios(bench, store.names)]
+
+
+def format_results(results):
+    lines = ['{:<40} {:>9} {:>9} {:>10} {:>12}'.format('scenario', 'p50 ms', 'p95 ms', 'req/s', 'bytes')]
+    for result in results:
+        lines.append('{scenario:<40} {p50_ms:>9.2f} {p95_ms:>9.2f} {throughput_rps:>10.1f} {response_bytes:>12}'.format(**result))
+    return '\n'.join(lines)
+
+
+def main(args):
+    results = []
+    for scale in args.scale or [None]:
+        label = scale or 'Data.csv'
+        scale_results = run(scale, args.repeat, args.gzip, args.result_cache)
+        for result in scale_results:
+            result['communities'] = label
+        results.extend(scale_results)
+        if not args.json:
+            print('communities: {}'.format(label))
+            print(format_results(scale_results))
+            print('')
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0
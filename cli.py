@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" Maintenance commands for the app. Run `python cli.py --help`. """
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+importtime_line = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+
+def parse_importtime(output):
+    """ (self_us, cumulative_us, depth, module) rows from `python -X importtime` output. """
+    rows = []
+    for line in output.splitlines():
+        match = importtime_line.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            rows.append((int(match.group(1)), int(match.group(2)), depth, match.group(4)))
+    return rows
+
+
+def importtime(args):
+    env = dict(os.environ)
+    env.setdefault('MAPBOX_ACCESS_TOKEN', 'importtime')
+    env.setdefault('DATASET_POLL_INTERVAL', '0')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + args.module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=here,
+        env=env
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        return proc.returncode
+
+    rows = parse_importtime(proc.stderr)
+    total_ms = sum(row[0] for row in rows) / 1000.0
+    print('{:>10}  {:>10}  {}'.format('self ms', 'total ms', 'module'))
+    top = sorted((row for row in rows if row[2] <= args.depth), key=lambda row: -row[1])
+    for self_us, cumulative_us, depth, module in top[:args.top]:
+        print('{:>10.1f}  {:>10.1f}  {}{}'.format(self_us / 1000.0, cumulative_us / 1000.0, '  ' * depth, module))
+    print('{} modules imported in {:.1f} ms'.format(len(rows), total_ms))
+
+    if args.budget and total_ms > args.budget:
+        print('Import time {:.1f} ms is over the {:.1f} ms budget'.format(total_ms, args.budget))
+        return 1
+    return 0
+
+
+def compile_data(args):
+    from dataset import compile_dataset
+    from schema import SchemaError
+
+    try:
+        output = compile_dataset(args.csv, args.output)
+    except SchemaError as e:
+        for error in e.errors:
+            print('{}: {}'.format(args.csv, error))
+        return 1
+    except IOError as e:
+        print(e)
+        return 1
+    size = sum(os.path.getsize(os.path.join(output, name)) for name in os.listdir(output))
+    print('Wrote {} ({:.1f} kB, CSV {:.1f} kB)'.format(output, size / 1024.0, os.path.getsize(args.csv) / 1024.0))
+    return 0
+
+
+def score(args):
+    import numpy as np
+    import scoring
+    from dataset import load_communities
+
+    ranks = scoring.rank_array(load_communities(args.csv))
+    if args.scale:
+        ranks = ranks[np.random.RandomState(0).randint(0, len(ranks), args.scale)]
+    start = time.perf_counter()
+    try:
+        names, scores = scoring.score_profiles(ranks, args.profile)
+    except ValueError as e:
+        print(e)
+        return 1
+    elapsed = time.perf_counter() - start
+    print('{:<12} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('profile', *(scoring.level_names + ['changed'])))
+    for i, name in enumerate(names):
+        counts = np.bincount(scores.level[:, i], minlength=len(scoring.level_names))
+        changed = int((scores.level[:, i] != scores.level[:, 0]).sum())
+        print('{:<12} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(name, *(counts.tolist() + [changed])))
+    print('Scored {} communities under {} profiles in {:.1f} ms'.format(len(ranks), len(names), elapsed * 1000.0))
+    return 0
+
+
+def import_timeseries(args):
+    from timeseries import import_csv, TimeSeriesStore
+
+    variables = import_csv(args.csv, args.output, args.sum or ())
+    store = TimeSeriesStore(args.output)
+    print('Wrote {} ({} communities, {} days, variables: {})'.format(
+        args.output, len(store.communities), store.days, ', '.join(variables)))
+    return 0
+
+
+def bench(args):
+    # Imports the app, so keep it out of the other commands' startup
+    import benchmark
+    return benchmark.main(args)
+
+
+def loadtest(args):
+    import loadtest
+    return loadtest.main(args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('importtime', help='Profile the import of the app, slowest modules first')
+    command.add_argument('--module', default='application', help='module to import (default: application)')
+    command.add_argument('--top', type=int, default=25, help='number of modules to list')
+    command.add_argument('--depth', type=int, default=1, help='deepest nesting level to list')
+    command.add_argument('--budget', type=float, help='exit non-zero if the total exceeds this many ms')
+    command.set_defaults(func=importtime)
+
+    command = commands.add_parser('compile', help='Validate the CSV and compile it to the columnar copy the app loads')
+    command.add_argument('--csv', default=os.path.join(here, 'Data.csv'), help='source CSV (default: Data.csv)')
+    command.add_argument('--output', help='output directory (default: the CSV path with a .columns suffix)')
+    command.set_defaults(func=compile_data)
+
+    command = commands.add_parser('score', help='Compare risk levels under the weighting profiles in scoring.py')
+    command.add_argument('--csv', default=os.path.join(here, 'Data.csv'), help='source CSV (default: Data.csv)')
+    command.add_argument('--profile', action='append', help='profile to score; repeat for several (default: all). "changed" counts differences from the first')
+    command.add_argument('--scale', type=int, help='resample the ranks to this many communities')
+    command.set_defaults(func=score)
+
+    command = commands.add_parser('timeseries', help='Import daily climate observations into the store read via TIMESERIES_DIR')
+    command.add_argument('csv', help='CSV with community, date and one column per variable')
+    command.add_argument('--output', default=os.path.join(here, 'climate'), help='store directory (default: climate)')
+    command.add_argument('--sum', action='append', help='variable aggregated by sum rather than mean, e.g. pcpt; repeatable')
+    command.set_defaults(func=import_timeseries)
+
+    command = commands.add_parser('bench', help='Benchmark callback latency, throughput and response size in-process')
+    command.add_argument('--scale', type=int, action='append', help='synthetic dataset size; repeat for several (default: Data.csv)')
+    command.add_argument('--repeat', type=int, default=50, help='requests per scenario')
+    command.add_argument('--gzip', action='store_true', help='request gzip-encoded responses')
+    command.add_argument('--result-cache', action='store_true', help='serve repeated callbacks from the result cache')
+    command.add_argument('--json', action='store_true', help='print results as JSON')
+    command.set_defaults(func=bench)
+
+    command = commands.add_parser('loadtest', help='Measure throughput and latency of a running server as concurrent sessions grow')
+    command.add_argument('--url', default='http://127.0.0.1:8000/', help='server to test (default: http://127.0.0.1:8000/)')
+    command.add_argument('--sessions', type=int, action='append', help='concurrent sessions; repeat for several levels (default: 1, 4, 16, 32)')
+    command.add_argument('--duration', type=float, default=10, help='seconds per level')
+    command.add_argument('--think', type=float, default=0, help='mean seconds a session waits between dropdown changes')
+    command.add_argument('--json', action='store_true', help='print results as JSON')
+    command.set_defaults(func=loadtest)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
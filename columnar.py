@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# One .npy file per column plus a manifest. Loading skips CSV parsing and
+# validation, but every column is decoded into a new array in each process,
+# so this saves start-up time, not memory.
+#
+# Column kinds:
+#   category   small-int codes, with the labels kept in the manifest
+#   string     fixed-width unicode
+#   int8, ...  any other numpy dtype name, stored as-is
+format_version = 3
+
+
+def code_dtype(count):
+    return np.int8 if count < 128 else np.int16 if count < 32768 else np.int32
+
+
+def encode_column(values, kind):
+    """ (array to save, manifest entry extras) for one column. """
+    if kind == 'category':
+        codes, categories = pd.factorize(values, sort=True)
+        return codes.astype(code_dtype(len(categories))), {'categories': [str(c) for c in categories]}
+    if kind == 'string' or (kind is None and values.dtype == object):
+        # Fixed-width unicode, so it can be saved without pickling
+        return values.astype(str), {'kind': 'string'}
+    if kind is None:
+        return values, {'kind': values.dtype.name}
+    return values.astype(kind), {}
+
+
+def decode_column(values, column):
+    kind = column['kind']
+    if kind == 'category':
+        return np.array(column['categories'], dtype=object)[values]
+    if kind == 'string':
+        return values.astype(object)
+    return values
+
+
+def export_columns(communities, directory, kinds=None, source=None):
+    """ Write the DataFrame to `directory`, which appears atomically.
+
+    `kinds` maps column names to a storage kind; other columns keep their
+    dtype. `source` (e.g. the digest of the CSV) is recorded in the manifest.
+    """
+    kinds = kinds or {}
+    parent = os.path.dirname(os.path.abspath(directory))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.columns-')
+    columns = []
+    for i, name in enumerate(communities.columns):
+        values, extras = encode_column(communities[name].values, kinds.get(name))
+        np.save(os.path.join(tmp, '%d.npy' % i), values, allow_pickle=False)
+        columns.append(dict({'name': name, 'kind': kinds.get(name)}, **extras))
+    with open(os.path.join(tmp, 'columns.json'), 'w') as f:
+        json.dump({'version': format_version, 'source': source, 'rows': len(communities), 'columns': columns}, f)
+    # mkdtemp creates the directory private to this user
+    os.chmod(tmp, 0o755)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process wrote `directory` first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def replace_columns(communities, directory, kinds=None, source=None):
+    """ Like export_columns, but overwrites an existing copy.
+
+    Anything else at `directory` is left alone and raises IOError, so a
+    mistyped output path never deletes unrelated files.
+    """
+    if os.path.exists(directory):
+        if not os.path.isfile(os.path.join(directory, 'columns.json')):
+            raise IOError('{} exists and is not a columnar copy; refusing to overwrite it'.format(directory))
+        shutil.rmtree(directory)
+    export_columns(communities, directory, kinds, source)
+
+
+def read_manifest(directory):
+    """ The manifest of the copy in `directory`, or None if missing or in an older format. """
+    try:
+        with open(os.path.join(directory, 'columns.json')) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and manifest.get('version') == format_version else None
+
+
+def load_columns(directory, mmap_mode='r'):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise IOError('No columnar copy in {}'.format(directory))
+    data = OrderedDict()
+    for i, column in enumerate(manifest['columns']):
+        values = np.load(os.path.join(directory, '%d.npy' % i), mmap_mode=mmap_mode, allow_pickle=False)
+        data[column['name']] = decode_column(values, column)
+    return pd.DataFrame(data, columns=list(data))
+
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+import columnar
+import schema
+from store import CommunityStore
+
+logger = logging.getLogger(__name__)
+
+# A snapshot is never mutated after it is built; callbacks read
+# `dataset.current` once and keep using that object.
+Snapshot = namedtuple('Snapshot', ['version', 'communities', 'store', 'derived'])
+
+
+def read_csv(path):
+    """ Parse and validate the source CSV. """
+    # 'None' is a Risk Level, not a missing value
+    return schema.validate(pd.read_csv(path, keep_default_na=False))
+
+
+def compiled_path(path):
+    return os.path.splitext(path)[0] + '.columns'
+
+
+def compile_dataset(path='Data.csv', output=None):
+    """ Validate the CSV and write its typed columnar copy (see `python cli.py compile`). """
+    output = output or compiled_path(path)
+    columnar.replace_columns(read_csv(path)[list(schema.columns)], output, schema.columns, file_digest(path))
+    return output
+
+
+def load_communities(path='Data.csv'):
+    """ Load the compiled copy of `path` when it matches the CSV, otherwise the CSV itself. """
+    compiled = compiled_path(path)
+    manifest = columnar.read_manifest(compiled)
+    if manifest is not None and manifest['source'] == file_digest(path):
+        return columnar.load_columns(compiled)
+    if manifest is not None:
+        logger.warning('%s is out of date with %s; reading the CSV', compiled, path)
+    return read_csv(path)
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DatasetManager(object):
+    """ Watches the dataset file and swaps in a fully built snapshot when it changes.
+
+    `build(store)` returns a dict of everything derived from the data (figures,
+    layout, ...). It runs on the watcher thread, never on the request path.
+    """
+
+    def __init__(self, path, build, load=load_communities, interval=30):
+        self.path = path
+        self.build = build
+        self.load = load
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stat = self._file_stat()
+        self.current = self._make_snapshot(file_digest(path))
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _make_snapshot(self, digest):
+        communities = self.load(self.path)
+        store = CommunityStore(communities)
+        return Snapshot(digest[:12], communities, store, self.build(store))
+
+    def check(self, force=False):
+        """ Reload if the file changed. Returns True when a new snapshot was swapped in. """
+        with self._lock:
+            stat = self._file_stat()
+            if stat == self._stat and not force:
+                return False
+            digest = file_digest(self.path)
+            if digest[:12] == self.current.version and not force:
+                self._stat = stat
+                return False
+            snapshot = self._make_snapshot(digest)
+            self._stat = stat
+            self.current = snapshot
+        logger.info('Loaded %s version %s', self.path, snapshot.version)
+        return True
+
+    def reload(self):
+        return self.check(force=True)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # Keep serving the last good snapshot
+                logger.exception('Failed to reload %s', self.path)
+
+    def start(self):
+        """ Start the background watcher (once per process, after any fork). """
+        with self._lock:
+            if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._watch, name='dataset-watcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
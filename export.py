@@ -0,0 +1,186 @@
+""" Streaming bulk export of community records as CSV, JSON Lines or Parquet.
+
+Rows are read from the store's column arrays `chunk_rows` at a time and
+encoded as they are sent, so no export is ever built whole in memory.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+import flask
+
+import httpcache
+import schema
+
+chunk_rows = 1000
+
+mimetypes = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def column_chunks(store, positions, columns, size=chunk_rows):
+    """ Lists of plain Python values per column, `size` rows at a time. """
+    for start in range(0, len(positions), size):
+        chunk = positions[start:start + size]
+        yield [store.columns[column][chunk].tolist() for column in columns]
+
+
+def csv_stream(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for values in chunks:
+        writer.writerows(zip(*values))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def jsonl_stream(chunks, columns):
+    for values in chunks:
+        lines = [json.dumps(dict(zip(columns, row))) for row in zip(*values)]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class ChunkSink(object):
+    """ Write-only file object that hands back whatever was written since the last `drain`. """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_type(pa, column, values):
+    kind = schema.columns.get(column)
+    if kind == 'int8':
+        return pa.int8()
+    if kind in ('category', 'string') or values.dtype.kind in 'OU':
+        return pa.string()
+    return pa.from_numpy_dtype(values.dtype)
+
+
+def parquet_stream(store, positions, columns, size=chunk_rows):
+    """ One Parquet row group per chunk, each sent as soon as it is written. """
+    # Optional dependency, only needed for Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_schema = pa.schema([(column, arrow_type(pa, column, store.columns[column])) for column in columns])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, arrow_schema)
+    try:
+        for start in range(0, max(len(positions), 1), size):
+            chunk = positions[start:start + size]
+            arrays = [
+                pa.array(store.columns[column][chunk], type=field.type)
+                for column, field in zip(columns, arrow_schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=arrow_schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def gzip_stream(stream, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for data in stream:
+        data = compressor.compress(data)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_sort(values):
+    """ DataTable-style sort_by from `sort` parameters; a leading '-' sorts descending. """
+    return [
+        {'column_id': value.lstrip('-'), 'direction': 'desc' if value.startswith('-') else 'asc'}
+        for value in values
+    ]
+
+
+def records_stream(store, positions, columns, fmt):
+    if fmt == 'parquet':
+        return parquet_stream(store, positions, columns)
+    chunks = column_chunks(store, positions, columns)
+    return csv_stream(chunks, columns) if fmt == 'csv' else jsonl_stream(chunks, columns)
+
+
+def install(app, get_snapshot, url='export/communities.<fmt>'):
+    """ Add the export route to the Dash app's server.
+
+    Query parameters: `community` (repeatable, default every community),
+    `filter` (DataTable filter syntax), `sort` (repeatable column name,
+    '-' prefix for descending), `columns` (comma separated) and `gzip=1`.
+    """
+
+    def export_communities(fmt):
+        if fmt not in mimetypes:
+            flask.abort(404)
+        snapshot = get_snapshot()
+        store = snapshot.store
+        args = flask.request.args
+        columns = args.get('columns')
+        columns = columns.split(',') if columns else [c for c in schema.columns if c in store.columns]
+        unknown = [column for column in columns if column not in store.columns]
+        if unknown:
+            flask.abort(400, 'Unknown columns: ' + ', '.join(unknown))
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                flask.abort(501, 'Parquet export needs pyarrow installed')
+        compress = args.get('gzip') == '1'
+
+        # Same dataset version and query, same bytes
+        etag = '{}-{}'.format(snapshot.version, httpcache.content_etag(flask.request.query_string))
+        if etag in flask.request.if_none_match:
+            response = flask.Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        community = args.getlist('community') or store.names
+        positions = store.select(community, args.get('filter', ''), parse_sort(args.getlist('sort')))
+        stream = records_stream(store, positions, columns, fmt)
+        filename = 'communities.' + fmt
+        if compress:
+            stream = gzip_stream(stream)
+            filename += '.gz'
+        response = flask.Response(stream, mimetype='application/gzip' if compress else mimetypes[fmt])
+        # Streamed as generated. Flask-Compress leaves it alone only because
+        # these mimetypes are not in COMPRESS_MIMETYPES; adding one there
+        # would make it buffer and compress the whole export in memory.
+        response.set_etag(etag)
+        response.headers['Content-Disposition'] = 'attachment; filename=' + filename
+        response.headers['X-Dataset-Version'] = snapshot.version
+        return response
+
+    app.server.add_url_rule(app.config['routes_pathname_prefix'] + url, 'export_communities', export_communities)
@@ -0,0 +1,38 @@
+import gc
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# gthread (the default) keeps browser connections alive between callbacks,
+# and one slow client no longer blocks a whole worker. Callbacks are
+# CPU-bound (building lists, JSON encoding), so threads do not add
+# throughput beyond the worker count. 'gevent' needs the gevent package;
+# 'sync' is the old one-request-per-worker mode.
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+# Gunicorn turns 'sync' into gthread when threads > 1
+threads = int(os.environ.get('THREADS', 8 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 200))
+# Idle browser connections stay open between callbacks
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+# Import application.py (and load the dataset) once in the master. Workers
+# inherit the parsed data, figures and layout copy-on-write instead of each
+# building their own.
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+
+def pre_fork(server, worker):
+    # Keep the collector from touching (and so copying) inherited objects
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+# Send the app's own INFO logs (dataset reloads, result cache hit rates) to
+# stderr next to gunicorn's. Gunicorn's loggers stop propagating so nothing
+# is printed twice, and the access log stays off as it is by default.
+logconfig_dict = {
+    'root': {'level': 'INFO', 'handlers': ['error_console']},
+    'loggers': {
+        'gunicorn.error': {'level': 'INFO', 'handlers': ['error_console'], 'propagate': False, 'qualname': 'gunicorn.error'},
+        'gunicorn.access': {'level': 'WARNING', 'handlers': [], 'propagate': False, 'qualname': 'gunicorn.access'}
+    }
+}
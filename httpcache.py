@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import os
+import threading
+
+import flask
+
+
+def content_etag(data):
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def precompress(body, level=9):
+    """ {content-coding: bytes} of `body`, compressed once at the highest level. """
+    encoded = {'gzip': gzip.compress(body, level)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        encoded['br'] = brotli.compress(body)
+    return encoded
+
+
+def preferred_encoding(encoded):
+    accept = flask.request.accept_encodings
+    for coding in ('br', 'gzip'):
+        if coding in encoded and accept.quality(coding) > 0:
+            return coding
+    return None
+
+
+def conditional_response(body, etag, mimetype='application/json', cache_control='no-cache', encoded=None):
+    """ Serve pre-encoded bytes, answering a matching If-None-Match with 304.
+
+    `encoded` holds precompressed variants of `body` (see `precompress`);
+    the one the client accepts is sent as-is, so nothing is compressed per request.
+    """
+    coding = preferred_encoding(encoded) if encoded else None
+    response = flask.Response(encoded[coding] if coding else body, mimetype=mimetype)
+    if coding:
+        # Flask-Compress leaves responses that already have a Content-Encoding alone
+        response.headers['Content-Encoding'] = coding
+        etag = '{}-{}'.format(etag, coding)
+    if encoded:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(flask.request)
+
+
+def cache_dependencies(app):
+    """ Serve _dash-dependencies from bytes encoded and compressed on the first request. """
+    endpoint = app.config['routes_pathname_prefix'] + '_dash-dependencies'
+    view = app.server.view_functions[endpoint]
+    cached = {}
+    lock = threading.Lock()
+
+    def serve_dependencies():
+        # Callbacks are all registered before the first request
+        if 'etag' not in cached:
+            with lock:
+                if 'etag' not in cached:
+                    body = view().get_data()
+                    cached['body'] = body
+                    cached['encoded'] = precompress(body)
+                    cached['etag'] = content_etag(body)
+        return conditional_response(cached['body'], cached['etag'], encoded=cached['encoded'])
+
+    app.server.view_functions[endpoint] = serve_dependencies
+
+
+class AssetCache(object):
+    """ Content-hash ETags and Cache-Control headers for files in the Dash assets folder.
+
+    Dash adds `?m=<mtime>` to the CSS and JS it links, so those URLs are
+    immutable; other assets (logos) get a shorter max-age and revalidate.
+    """
+
+    def __init__(self, app, folder, max_age=86400, immutable_max_age=31536000):
+        self.folder = folder
+        self.url_path = app.config['routes_pathname_prefix'] + 'assets/'
+        self.max_age = max_age
+        self.immutable_max_age = immutable_max_age
+        self._hashes = {}
+        app.server.after_request(self)
+
+    def file_etag(self, path):
+        mtime = os.stat(path).st_mtime
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = (mtime, content_etag(f.read()))
+            self._hashes[path] = cached
+        return cached[1]
+
+    def __call__(self, response):
+        request = flask.request
+        if response.status_code not in (200, 304) or not request.path.startswith(self.url_path):
+            return response
+        path = os.path.join(self.folder, request.path[len(self.url_path):])
+        if not os.path.isfile(path):
+            return response
+        if 'm' in request.args:
+            response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(self.immutable_max_age)
+        else:
+            response.headers['Cache-Control'] = 'public, max-age={}'.format(self.max_age)
+        response.set_etag(self.file_etag(path))
+        return response.make_conditional(request)
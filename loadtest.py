@@ -0,0 +1,167 @@
+""" Concurrent-session load test against a running server.
+
+Every simulated session loads the layout like a browser would, then keeps
+picking communities and firing the server callbacks a dropdown change
+triggers. Run it against gunicorn with different WORKER_CLASS / THREADS
+settings to compare how throughput scales with concurrent users.
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from benchmark import percentile_ms
+
+
+def find_components(layout, found=None):
+    """ {id: props} for every component with an id in a serialized layout. """
+    found = {} if found is None else found
+    if isinstance(layout, list):
+        for child in layout:
+            find_components(child, found)
+    elif isinstance(layout, dict):
+        props = layout.get('props', {})
+        if 'id' in props:
+            found[props['id']] = props
+        find_components(props.get('children'), found)
+    return found
+
+
+class Session(object):
+    """ One browser: a keep-alive connection plus the component state it would send. """
+
+    def __init__(self, base_url, rng, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/') + '/'
+        self.rng = rng
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, path, payload=None):
+        if self.connection is None:
+            self.connection = HTTPConnection(self.host, self.port, timeout=self.timeout)
+        connection = self.connection
+        body = None if payload is None else json.dumps(payload).encode('utf-8')
+        try:
+            connection.putrequest('GET' if body is None else 'POST', self.prefix + path, skip_accept_encoding=True)
+            connection.putheader('Accept-Encoding', 'gzip')
+            if body is not None:
+                connection.putheader('Content-Type', 'application/json')
+                connection.putheader('Content-Length', str(len(body)))
+            connection.endheaders(body)
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            connection.close()
+            self.connection = None
+            raise
+        if response.status >= 400:
+            raise IOError('{} returned {}'.format(path, response.status))
+        if response.getheader('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return data
+
+    def start(self):
+        """ Fetch the layout and callbacks, keeping the server callbacks the community dropdown feeds. """
+        components = find_components(json.loads(self.request('_dash-layout').decode('utf-8')))
+        dependencies = json.loads(self.request('_dash-dependencies').decode('utf-8'))
+        self.names = [option['value'] for option in components['community']['options']]
+        self.callbacks = []
+        for dependency in dependencies:
+            if dependency.get('clientside_function'):
+                continue
+            inputs = [(i['id'], i['property']) for i in dependency['inputs']]
+            if ('community', 'value') in inputs:
+                self.callbacks.append((dependency, components))
+
+    def payload(self, dependency, components, selection):
+        def value(item):
+            if (item['id'], item['property']) == ('community', 'value'):
+                return selection
+            return components.get(item['id'], {}).get(item['property'])
+        return {
+            'output': dependency['output'],
+            'inputs': [dict(i, value=value(i)) for i in dependency['inputs']],
+            'state': [dict(s, value=value(s)) for s in dependency.get('state', [])]
+        }
+
+    def step(self, max_selection=5):
+        """ One dropdown change: every dependent callback, one after another like the browser queue. """
+        selection = self.rng.sample(self.names, self.rng.randint(1, min(max_selection, len(self.names))))
+        timings = []
+        for dependency, components in self.callbacks:
+            start = time.perf_counter()
+            self.request('_dash-update-component', self.payload(dependency, components, selection))
+            timings.append(time.perf_counter() - start)
+        return timings
+
+
+def run_level(base_url, sessions, duration, think=0, seed=0):
+    """ Drive `sessions` concurrent sessions for `duration` seconds. """
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(number):
+        session = Session(base_url, random.Random(seed + number))
+        try:
+            session.start()
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        while time.perf_counter() < deadline:
+            try:
+                step = session.step()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                time.sleep(0.1)
+                continue
+            with lock:
+                timings.extend(step)
+            if think:
+                time.sleep(session.rng.uniform(0, 2 * think))
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'sessions': sessions,
+        'requests': len(timings),
+        'errors': errors[0],
+        'throughput_rps': len(timings) / elapsed,
+        'p50_ms': percentile_ms(timings, 50) if timings else 0.0,
+        'p95_ms': percentile_ms(timings, 95) if timings else 0.0
+    }
+
+
+header = '{:>9} {:>9} {:>7} {:>10} {:>9} {:>9}'.format('sessions', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms')
+
+
+def format_result(result):
+    return '{sessions:>9} {requests:>9} {errors:>7} {throughput_rps:>10.1f} {p50_ms:>9.2f} {p95_ms:>9.2f}'.format(**result)
+
+
+def main(args):
+    results = []
+    if not args.json:
+        print(header)
+    for sessions in args.sessions or [1, 4, 16, 32]:
+        results.append(run_level(args.url, sessions, args.duration, args.think))
+        if not args.json:
+            print(format_result(results[-1]))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 1 if any(result['errors'] for result in results) else 0
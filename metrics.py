@@ -0,0 +1,193 @@
+""" Callback and endpoint timing, exported in Prometheus text format.
+
+Nothing is wrapped unless instrumentation is enabled, so a disabled
+`Instrumentation` costs nothing per request.
+"""
+
+import functools
+import threading
+import time
+
+import flask
+
+time_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+size_buckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in pairs) + '}'
+
+
+class Counter(object):
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        # Copied under the lock: another thread may be adding a label set
+        with self._lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.append('{}{} {}'.format(self.name, format_labels(key), value))
+        return lines
+
+
+class Histogram(object):
+
+    def __init__(self, name, help, buckets=time_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+        for key, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('{}_bucket{} {}'.format(self.name, format_labels(key, [('le', bound)]), bucket_count))
+            lines.append('{}_bucket{} {}'.format(self.name, format_labels(key, [('le', '+Inf')]), count))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(key), total))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(key), count))
+        return lines
+
+
+class Instrumentation(object):
+    """ Records callback wall, compute and serialization time, payload bytes and cache hits.
+
+    Decorate callbacks with `timed` (below `@app.callback`) to split compute
+    from JSON encoding, then call `install(app)` once every callback is
+    registered. Metrics are per process; scrape each gunicorn worker.
+    """
+
+    def __init__(self, enabled=False, server_timing=False):
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.callback_seconds = Histogram('dash_callback_seconds', 'Callback wall time including JSON encoding.')
+        self.compute_seconds = Histogram('dash_callback_compute_seconds', 'Time spent inside the callback function.')
+        self.serialize_seconds = Histogram('dash_callback_serialize_seconds', 'Time spent encoding the callback response.')
+        self.endpoint_seconds = Histogram('dash_endpoint_seconds', 'Wall time of the layout and dependencies endpoints.')
+        self.response_bytes = Histogram(
+            'dash_response_bytes', 'Response body size before Flask-Compress; encoding says if it was sent precompressed.', size_buckets
+        )
+        self.cache_requests = Counter('dash_cache_requests_total', 'Cache lookups by cache and result.')
+        self.metrics = [
+            self.callback_seconds, self.compute_seconds, self.serialize_seconds,
+            self.endpoint_seconds, self.response_bytes, self.cache_requests
+        ]
+        self._local = threading.local()
+
+    def timed(self, func):
+        """ Record the callback's own compute time. """
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def timed_callback(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.compute = time.perf_counter() - start
+        return timed_callback
+
+    def cache(self, name, hit):
+        if self.enabled:
+            self.cache_requests.inc(cache=name, result='hit' if hit else 'miss')
+
+    def _server_timing(self, name, seconds):
+        if self.server_timing:
+            flask.g.setdefault('server_timing', []).append((name, seconds))
+
+    def _wrap_callback(self, callback):
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def instrumented(*args, **kwargs):
+            self._local.compute = None
+            start = time.perf_counter()
+            body = callback(*args, **kwargs)
+            total = time.perf_counter() - start
+            compute = self._local.compute
+            self.callback_seconds.observe(total, callback=name)
+            self.response_bytes.observe(len(body), endpoint=name, encoding='identity')
+            if compute is not None:
+                self.compute_seconds.observe(compute, callback=name)
+                self.serialize_seconds.observe(max(total - compute, 0.0), callback=name)
+                self._server_timing('compute', compute)
+                self._server_timing('serialize', max(total - compute, 0.0))
+            self._server_timing('callback', total)
+            return body
+        return instrumented
+
+    def _wrap_view(self, name, view):
+
+        @functools.wraps(view)
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            response = view(*args, **kwargs)
+            total = time.perf_counter() - start
+            self.endpoint_seconds.observe(total, endpoint=name, status=response.status_code)
+            self.response_bytes.observe(len(response.get_data()), endpoint=name, encoding=response.content_encoding or 'identity')
+            self._server_timing(name.strip('_'), total)
+            return response
+        return instrumented
+
+    def _add_server_timing(self, response):
+        timings = flask.g.get('server_timing')
+        if timings:
+            response.headers['Server-Timing'] = ', '.join(
+                '{};dur={:.2f}'.format(name, seconds * 1000.0) for name, seconds in timings
+            )
+        return response
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def serve_metrics(self):
+        return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def install(self, app):
+        """ Wrap every server-side callback plus the layout/dependencies views and add /metrics. """
+        if not self.enabled:
+            return
+        for entry in app.callback_map.values():
+            if 'callback' not in entry:
+                continue  # clientside
+            entry['callback'] = self._wrap_callback(entry['callback'])
+        prefix = app.config['routes_pathname_prefix']
+        for name in ('_dash-layout', '_dash-dependencies'):
+            endpoint = prefix + name
+            app.server.view_functions[endpoint] = self._wrap_view(name, app.server.view_functions[endpoint])
+        app.server.add_url_rule(prefix + 'metrics', 'metrics', self.serve_metrics)
+        if self.server_timing:
+            app.server.after_request(self._add_server_timing)
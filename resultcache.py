@@ -0,0 +1,228 @@
+""" Memoized callback responses, keyed by dataset version and callback arguments.
+
+Every user who picks the same communities gets the same table page and
+plot, so the encoded responses are kept in a per-process LRU and, when a
+directory is configured, in files shared by every gunicorn worker on the
+host. A hit skips both the callback and Dash's JSON encoding.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from store import normalize_selection
+
+logger = logging.getLogger(__name__)
+
+
+def selection_key(community):
+    """ Dropdown value as a tuple; a single name and a one-name list are the same selection.
+
+    Order is kept: the plot and the unsorted table list communities in
+    selection order.
+    """
+    return tuple(normalize_selection(community))
+
+
+class LRUCache(object):
+    """ Bounded in-memory mapping that drops the least recently used entry. """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+class FileCache(object):
+    """ Text files in `directory`, shared between processes.
+
+    Each file is the key on its first line followed by the value. Writes
+    are atomic renames, reads touch the file, and every `prune_every`
+    writes the oldest files by modification time go until `maxsize` are left.
+    """
+
+    def __init__(self, directory, maxsize=1024, prune_every=64):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.entry')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, encoding='utf-8', newline='') as f:
+                # Two keys with the same digest would be a collision, not a hit
+                value = f.read() if f.readline() == key + '\n' else None
+            if value is not None:
+                os.utime(path)
+        except OSError:
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(key + '\n')
+                f.write(value)
+            os.replace(temporary, self.path(key))
+        except Exception:
+            os.unlink(temporary)
+            raise
+        with self._lock:
+            self.writes += 1
+            prune = self.writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.entry'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.entry'):
+                os.unlink(entry.path)
+
+
+class ResultCache(object):
+    """ Two-level cache of callback responses: a local LRU in front of an optional shared `FileCache`.
+
+    `install(app, keys)` wraps the named callbacks, where each key function
+    turns the callback's inputs and state into something JSON-serializable.
+    Install it before `Instrumentation.install` so callback timings include
+    hits. Lookups are counted through `metrics.cache` as `<name>` and
+    `<name>-shared` when metrics are enabled, and the hit rates are logged
+    every `log_every` lookups either way.
+    """
+
+    def __init__(self, get_version, maxsize=256, directory=None, shared_maxsize=1024, metrics=None, log_every=1000):
+        self.get_version = get_version
+        self.local = LRUCache(maxsize)
+        self.shared = FileCache(directory, shared_maxsize) if directory else None
+        self.metrics = metrics
+        self.enabled = maxsize > 0 or self.shared is not None
+        self.log_every = log_every
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name, hit):
+        if self.metrics is not None:
+            self.metrics.cache(name, hit)
+
+    def lookup(self, name, key):
+        value = self.local.get(key) if self.local.maxsize > 0 else None
+        self._count(name, value is not None)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            self._count(name + '-shared', value is not None)
+            if value is not None and self.local.maxsize > 0:
+                self.local.set(key, value)
+        with self._lock:
+            self.lookups += 1
+            log = self.log_every and self.lookups % self.log_every == 0
+        if log:
+            self.log_stats()
+        return value
+
+    def store(self, key, value):
+        if self.local.maxsize > 0:
+            self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def _wrap_callback(self, callback, key):
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def cached(*args):
+            if not self.enabled:
+                return callback(*args)
+            version = self.get_version()
+            cache_key = json.dumps([name, version, key(*args)], sort_keys=True, separators=(',', ':'))
+            body = self.lookup(name, cache_key)
+            if body is None:
+                body = callback(*args)
+                # A response built from a newer dataset must not be filed under the old version
+                if self.get_version() == version:
+                    self.store(cache_key, body)
+            return body
+        return cached
+
+    def install(self, app, keys):
+        """ Cache the responses of the server-side callbacks named in `keys`. """
+        for entry in app.callback_map.values():
+            if 'callback' not in entry:
+                continue  # clientside
+            key = keys.get(entry['callback'].__name__)
+            if key is not None:
+                entry['callback'] = self._wrap_callback(entry['callback'], key)
+
+    def stats(self):
+        """ Hit and miss counts per level since start-up. """
+        levels = [('local', self.local)] + ([('shared', self.shared)] if self.shared is not None else [])
+        return {level: {'hits': cache.hits, 'misses': cache.misses} for level, cache in levels}
+
+    def log_stats(self):
+        parts = []
+        for level, counts in sorted(self.stats().items()):
+            total = counts['hits'] + counts['misses']
+            parts.append('{} {}/{} hits ({:.0%})'.format(level, counts['hits'], total, counts['hits'] / total if total else 0.0))
+        logger.info('Result cache: %s', ', '.join(parts))
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+rank_columns = ['Permafrost Occurrence', 'Permafrost Temperature', 'Thaw Susceptibility', 'Massive Ice', 'Existing Problems']
+
+# Inclusive Rating Score range of each Risk Level
+risk_level_scores = OrderedDict([
+    ('None', (0, 0)),
+    ('Low', (1, 8)),
+    ('Medium', (9, 11)),
+    ('High', (12, 15))
+])
+
+# Storage type of every source column in the compiled columnar copy
+columns = OrderedDict(
+    [('Community', 'string'), ('Confidence', 'category')] +
+    [(column, 'int8') for column in rank_columns] +
+    [(column + ' Label', 'category') for column in rank_columns] +
+    [(column + ' Table', 'category') for column in rank_columns] +
+    [('Rating Score', 'int8'), ('Risk Level', 'category'), ('Latitude', 'float64'), ('Longitude', 'float64')]
+)
+
+
+class SchemaError(ValueError):
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(SchemaError, self).__init__('; '.join(errors))
+
+
+def sample(names, mask, limit=5):
+    bad = list(names[mask][:limit])
+    more = int(mask.sum()) - len(bad)
+    return ', '.join(bad) + (' and {} more'.format(more) if more > 0 else '')
+
+
+def validate(communities):
+    """ Raise SchemaError listing every problem found in the dataset. """
+    missing = [column for column in columns if column not in communities.columns]
+    if missing:
+        raise SchemaError(['missing columns: ' + ', '.join(missing)])
+
+    errors = []
+    names = communities['Community'].astype(str).values
+    duplicated = communities['Community'].duplicated().values
+    if duplicated.any():
+        errors.append('duplicate communities: ' + sample(names, duplicated))
+
+    for column in rank_columns:
+        bad = ~communities[column].isin([0, 1, 2, 3]).values
+        if bad.any():
+            errors.append('{} outside 0-3 for {}'.format(column, sample(names, bad)))
+
+    bad = (communities[rank_columns].sum(axis=1) != communities['Rating Score']).values
+    if bad.any():
+        errors.append('Rating Score is not the sum of the ranks for ' + sample(names, bad))
+
+    score = communities['Rating Score']
+    levels = communities['Risk Level']
+    unknown = ~levels.isin(list(risk_level_scores)).values
+    if unknown.any():
+        errors.append('unknown Risk Level for ' + sample(names, unknown))
+    for level, (low, high) in risk_level_scores.items():
+        bad = ((levels == level) & ((score < low) | (score > high))).values
+        if bad.any():
+            errors.append('Risk Level {} needs a Rating Score of {}-{} for {}'.format(level, low, high, sample(names, bad)))
+
+    for column, limit in (('Latitude', 90), ('Longitude', 180)):
+        bad = ~communities[column].between(-limit, limit).values
+        if bad.any():
+            errors.append('{} out of range for {}'.format(column, sample(names, bad)))
+
+    if errors:
+        raise SchemaError(errors)
+    return communities
@@ -0,0 +1,85 @@
+""" Rating scores, risk levels and marker sizes for every community at once.
+
+Ranks are an (n, 5) array in `schema.rank_columns` order. A profile weights
+the five ranks and places the Medium and High cut-offs as a fraction of the
+highest possible score; the default profile reproduces the published
+scores (0 = None, up to 8 Low, 9-11 Medium, 12-15 High).
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from schema import rank_columns
+
+level_names = ['None', 'Low', 'Medium', 'High']
+
+Profile = namedtuple('Profile', ['weights', 'medium', 'high'])
+
+# Weights in rank_columns order: occurrence, temperature, thaw, massive ice, existing problems
+profiles = OrderedDict([
+    ('default', Profile((1, 1, 1, 1, 1), 0.6, 0.8)),
+    ('ground-ice', Profile((1, 1, 2, 2, 1), 0.6, 0.8)),
+    ('thermal', Profile((1, 2, 1, 1, 1), 0.6, 0.8)),
+    ('observed', Profile((1, 1, 1, 1, 2), 0.6, 0.8))
+])
+
+Scores = namedtuple('Scores', ['score', 'level', 'size'])
+
+
+def get_profile(profile):
+    if isinstance(profile, Profile):
+        return profile
+    if profile not in profiles:
+        raise ValueError('Unknown scoring profile {!r}, expected one of {}'.format(profile, ', '.join(profiles)))
+    return profiles[profile]
+
+
+def rank_array(communities):
+    """ (n, 5) int array of ranks from a DataFrame with the rank columns. """
+    return communities[rank_columns].values.astype(np.int64)
+
+
+def thresholds(profile):
+    """ Lowest score of the Medium and High levels. """
+    profile = get_profile(profile)
+    top = 3 * sum(profile.weights)
+    return np.ceil(profile.medium * top - 1e-9), np.ceil(profile.high * top - 1e-9)
+
+
+def score(ranks, profile='default'):
+    """ Weighted Rating Score, 0-3 level code and marker size for every row of `ranks`. """
+    profile = get_profile(profile)
+    scores = np.asarray(ranks).dot(np.asarray(profile.weights, dtype=np.int64))
+    medium, high = thresholds(profile)
+    level = (scores > 0).astype(np.int8) + (scores >= medium) + (scores >= high)
+    return Scores(scores, level, level.astype(float))
+
+
+def score_profiles(ranks, names=None):
+    """ Scores under several profiles at once: `score` and `level` are (n, profiles) arrays. """
+    names = list(names or profiles)
+    chosen = [get_profile(name) for name in names]
+    weights = np.array([profile.weights for profile in chosen], dtype=np.int64).T
+    scores = np.asarray(ranks).dot(weights)
+    cuts = np.array([thresholds(profile) for profile in chosen])
+    level = (scores > 0).astype(np.int8) + (scores >= cuts[:, 0]) + (scores >= cuts[:, 1])
+    return names, Scores(scores, level, level.astype(float))
+
+
+def level_labels(level):
+    return np.array(level_names, dtype=object)[level]
+
+
+def level_colors(level, palette):
+    """ Hex color per row from a {level name: color} palette. """
+    return np.array([palette[name] for name in level_names], dtype=object)[level]
+
+
+def rescore(communities, profile='default'):
+    """ Copy of the DataFrame with Rating Score and Risk Level recomputed under `profile`. """
+    scores = score(rank_array(communities), profile)
+    rescored = communities.copy()
+    rescored['Rating Score'] = scores.score
+    rescored['Risk Level'] = level_labels(scores.level)
+    return rescored
@@ -0,0 +1,37 @@
+import numpy as np
+
+from spatial import earth_radius_km
+
+
+class SimilarityIndex(object):
+    """ k-nearest-neighbour search over the five hazard ranks plus location.
+
+    Each community is a point made of its 0-3 ranks and its position on the
+    unit sphere, scaled so `location_km` apart counts about as much as one
+    rank step. A query is one matrix-vector product plus a partial sort.
+    """
+
+    def __init__(self, ranks, lat, lon, location_km=500.0):
+        lat, lon = np.radians(lat), np.radians(lon)
+        xyz = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+        self.features = np.ascontiguousarray(np.column_stack([
+            np.asarray(ranks, dtype=float),
+            xyz * (earth_radius_km / location_km)
+        ]))
+        self.norms = (self.features ** 2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.norms)
+
+    def nearest(self, position, k=5):
+        """ The `k` positions most similar to `position` (excluding it) and their distances, closest first. """
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return np.array([], dtype=int), np.array([])
+        # |a - b|^2 = |a|^2 - 2 a.b + |b|^2
+        distances = self.norms - 2 * self.features.dot(self.features[position]) + self.norms[position]
+        distances[position] = np.inf
+        candidates = np.argpartition(distances, k - 1)[:k]
+        # Ties broken by position so results are stable
+        order = candidates[np.lexsort((candidates, distances[candidates]))]
+        return order, np.sqrt(np.maximum(distances[order], 0.0))
@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+
+earth_radius_km = 6371.0
+km_per_degree = math.pi * earth_radius_km / 180.0
+
+
+def normalize_lon(lon):
+    return ((lon + 180.0) % 360.0) - 180.0
+
+
+def haversine_km(lat, lon, lat0, lon0):
+    lat, lon = np.radians(lat), np.radians(lon)
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * math.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def viewport_bounds(center, zoom, width=1000, height=400, tile_size=512):
+    """ Approximate (south, west, north, east) of a Mapbox view from its center and zoom. """
+    world = tile_size * 2.0 ** zoom
+    half_lon = 180.0 * width / world
+    lat = max(min(center['lat'], 85.0511), -85.0511)
+    # Web Mercator y of the center, in pixels from the top of the world
+    y = world / 2 - world / (2 * math.pi) * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    def lat_at(py):
+        return math.degrees(2 * math.atan(math.exp((world / 2 - py) * 2 * math.pi / world)) - math.pi / 2)
+
+    north = lat_at(max(y - height / 2.0, 0))
+    south = lat_at(min(y + height / 2.0, world))
+    return south, center['lon'] - half_lon, north, center['lon'] + half_lon
+
+
+class GridIndex(object):
+    """ Fixed-size lat/lon grid over point positions.
+
+    Supports bounding-box, radius and k-nearest queries; each returns row
+    positions into the arrays the index was built from.
+    """
+
+    def __init__(self, lat, lon, cell_size=1.0):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.cell_size = cell_size
+        self.cells = {}
+        rows = np.floor(self.lat / cell_size).astype(int)
+        cols = np.floor(self.lon / cell_size).astype(int)
+        if not len(rows):
+            return
+        order = np.lexsort((cols, rows))
+        changes = (np.diff(rows[order]) != 0) | (np.diff(cols[order]) != 0)
+        for group in np.split(order, np.flatnonzero(changes) + 1):
+            self.cells[(rows[group[0]], cols[group[0]])] = group
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _bbox(self, south, west, north, east):
+        size = self.cell_size
+        r0, r1 = int(math.floor(south / size)), int(math.floor(north / size))
+        c0, c1 = int(math.floor(west / size)), int(math.floor(east / size))
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            candidates = list(self.cells.values())
+        else:
+            candidates = [self.cells[key] for key in ((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)) if key in self.cells]
+        if not candidates:
+            return np.array([], dtype=int)
+        positions = np.concatenate(candidates)
+        lat, lon = self.lat[positions], self.lon[positions]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(positions[inside])
+
+    def bbox(self, south, west, north, east):
+        """ Positions inside the box. Boxes crossing the antimeridian (west > east) are handled. """
+        if east - west >= 360:
+            return self._bbox(south, -180.0, north, 180.0)
+        west, east = normalize_lon(west), normalize_lon(east)
+        if west > east:
+            return np.union1d(self._bbox(south, west, north, 180.0), self._bbox(south, -180.0, north, east))
+        return self._bbox(south, west, north, east)
+
+    def radius(self, lat, lon, km):
+        """ Positions within `km` of the point and their distances, nearest first. """
+        dlat = km / km_per_degree
+        # Widest longitude span inside the latitude band
+        coslat = math.cos(math.radians(min(abs(lat) + dlat, 89.999)))
+        dlon = min(km / (km_per_degree * coslat), 180.0)
+        positions = self.bbox(max(lat - dlat, -90.0), lon - dlon, min(lat + dlat, 90.0), lon + dlon)
+        distances = haversine_km(self.lat[positions], self.lon[positions], lat, lon)
+        keep = distances <= km
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind='mergesort')
+        return positions[order], distances[order]
+
+    def nearest(self, lat, lon, k=1):
+        """ The `k` nearest positions and their distances, nearest first. """
+        k = min(k, len(self))
+        km = self.cell_size * km_per_degree
+        while True:
+            positions, distances = self.radius(lat, lon, km)
+            if len(positions) >= k or km >= math.pi * earth_radius_km:
+                return positions[:k], distances[:k]
+            km *= 2
+
+    def clusters(self, positions, cell_size):
+        """ Group positions by `cell_size` degree cells.
+
+        Returns the cluster number of each position plus each cluster's
+        member count and mean lat/lon.
+        """
+        lat, lon = self.lat[positions], self.lon[positions]
+        rows = np.floor(lat / cell_size).astype(np.int64)
+        cols = np.floor(lon / cell_size).astype(np.int64)
+        rows -= rows.min()
+        cols -= cols.min()
+        _, inverse, counts = np.unique(rows * (cols.max() + 1) + cols, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        return inverse, counts, np.bincount(inverse, weights=lat) / counts, np.bincount(inverse, weights=lon) / counts
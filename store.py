@@ -0,0 +1,173 @@
+import re
+import threading
+from operator import eq, ge, gt, le, lt, ne
+
+import numpy as np
+
+import scoring
+from similarity import SimilarityIndex
+from spatial import GridIndex
+
+hazard_lu = ['Massive Ice', 'Thaw Susceptibility', 'Existing Problems', 'Permafrost Occurrence', 'Permafrost Temperature', 'Risk Level']
+
+# Only these go into table records, so table pages carry just the shown columns
+table_columns = [{'name': 'Community', 'id': 'Community'}, {'name': 'Confidence', 'id': 'Confidence'}, {'name': 'Permafrost Occurrence', 'id': 'Permafrost Occurrence Label'}, {'name': 'Permafrost Temperature', 'id': 'Permafrost Temperature Label'}, {'name': 'Thaw Susceptibility', 'id': 'Thaw Susceptibility Label'}, {'name': 'Massive Ice', 'id': 'Massive Ice Label'}, {'name': 'Existing Problems', 'id': 'Existing Problems Label'}, {'name': 'Rating Score', 'id': 'Rating Score'}, {'name': 'Risk Level', 'id': 'Risk Level'}]
+
+
+def normalize_selection(community):
+    """ Dropdown value can be None, a single name or a list of names. """
+    if community is None:
+        return []
+    if isinstance(community, str):
+        return [community]
+    return list(community)
+
+
+filter_clause = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s*(?P<operator>contains|datestartswith|>=|<=|!=|=|>|<|eq|ne|ge|le|gt|lt)\s*(?P<value>.*?)\s*$')
+filter_operators = {'eq': '=', 'ne': '!=', 'ge': '>=', 'le': '<=', 'gt': '>', 'lt': '<'}
+comparisons = {'=': eq, '!=': ne, '>=': ge, '<=': le, '>': gt, '<': lt}
+
+
+def parse_filter(query):
+    """ (column, operator, value) clauses from a DataTable `filter` string. """
+    clauses = []
+    for part in (query or '').split(' && '):
+        match = filter_clause.match(part)
+        if match is None:
+            continue
+        value = match.group('value')
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1]
+        operator = match.group('operator')
+        clauses.append((match.group('column'), filter_operators.get(operator, operator), value))
+    return clauses
+
+
+def clause_mask(values, operator, value):
+    if operator == 'contains':
+        return np.char.find(values.astype(str), value) >= 0
+    if operator == 'datestartswith':
+        return np.char.startswith(values.astype(str), value)
+    if values.dtype.kind in 'biuf':
+        try:
+            value = float(value)
+        except ValueError:
+            return np.zeros(len(values), dtype=bool)
+    return comparisons[operator](values, value)
+
+
+class CommunityStore(object):
+    """ Name-keyed index over the community DataFrame, built once per dataset. """
+
+    def __init__(self, communities):
+        self.communities = communities
+        self.names = communities['Community'].tolist()
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.records = communities[[column['id'] for column in table_columns]].to_dict('records')
+        self.scores = scoring.score(scoring.rank_array(communities))
+        # Bubble chart arrays: one row per community, one column per hazard_lu entry
+        labels = [hazard + ' Label' for hazard in hazard_lu[:5]] + ['Risk Level']
+        self.plot_texts = communities[labels].values.astype(object)
+        sizes = np.column_stack([
+            communities[hazard_lu[:5]].values.astype(float),
+            self.scores.size
+        ])
+        self.plot_sizes = sizes * 1.2 + 0.25
+        self.latitude = communities['Latitude'].values.astype(float)
+        self.longitude = communities['Longitude'].values.astype(float)
+        self.spatial = GridIndex(self.latitude, self.longitude)
+        self.similarity = SimilarityIndex(scoring.rank_array(communities), self.latitude, self.longitude)
+        self._categories = {}
+        self._lock = threading.Lock()
+        # Columnar copies for server-side table filtering and sorting
+        self.columns = {}
+        for name in communities.columns:
+            values = communities[name].values
+            self.columns[name] = values.astype(str) if values.dtype == object else values
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def positions(self, community):
+        """ Row positions of the selected communities, in selection order. """
+        index = self.index
+        return [index[name] for name in normalize_selection(community) if name in index]
+
+    def similar(self, community, k=5):
+        """ Names of the `k` communities most like `community` by hazard ranks and location. """
+        if community not in self.index:
+            return []
+        positions, _ = self.similarity.nearest(self.index[community], k)
+        return [self.names[i] for i in positions]
+
+    def plot_arrays(self, community):
+        """ Names plus flattened (row-major) bubble texts and sizes for the selection. """
+        positions = self.positions(community)
+        return {
+            'names': [self.names[i] for i in positions],
+            'texts': self.plot_texts[positions].ravel().tolist(),
+            'sizes': self.plot_sizes[positions].ravel().tolist()
+        }
+
+    def select(self, community, filter_query='', sort_by=None):
+        """ Row positions of the selection after a DataTable filter query and sort_by. """
+        positions = np.array(self.positions(community), dtype=int)
+        for column, operator, value in parse_filter(filter_query):
+            if column in self.columns:
+                positions = positions[clause_mask(self.columns[column][positions], operator, value)]
+        if sort_by:
+            positions = self._sort_order(positions, sort_by)
+        return positions
+
+    def table_page(self, community, page_current=0, page_size=20, filter_query='', sort_by=None):
+        """ One page of table records for the selection, filtered and sorted server-side. """
+        positions = self.select(community, filter_query, sort_by)
+        last_page = max(len(positions) - 1, 0) // page_size
+        start = min(page_current or 0, last_page) * page_size
+        records = self.records
+        return [records[i] for i in positions[start:start + page_size]]
+
+    def _sort_order(self, positions, sort_by):
+        keys = []
+        # np.lexsort sorts on the last key first
+        for sort in reversed(sort_by):
+            values = self.columns.get(sort['column_id'])
+            if values is None:
+                continue
+            codes = np.unique(values[positions], return_inverse=True)[1]
+            keys.append(-codes if sort['direction'] == 'desc' else codes)
+        if not keys:
+            return positions
+        return positions[np.lexsort(keys)]
+
+    def _memo(self, key, build):
+        # Double-checked so threaded workers build each entry once
+        value = self._categories.get(key)
+        if value is None:
+            with self._lock:
+                value = self._categories.get(key)
+                if value is None:
+                    value = self._categories[key] = build()
+        return value
+
+    def category_codes(self, risktype):
+        """ 0-3 (None/Low/Medium/High) per community; hazard columns already hold ranks. """
+        if risktype == 'Risk Level':
+            return self._memo(('codes', risktype), lambda: self.scores.level.astype(int))
+        return self._memo(('codes', risktype), lambda: self.communities[risktype].values.astype(int))
+
+    def category_labels(self, risktype):
+        label = 'Risk Level' if risktype == 'Risk Level' else risktype + ' Label'
+        return self._memo(('labels', risktype), lambda: (self.communities['Community'] + ': ' + self.communities[label]).values)
+
+    def category_label_codes(self, risktype):
+        """ Distinct labels of the category plus each community's index into them. """
+        label = 'Risk Level' if risktype == 'Risk Level' else risktype + ' Label'
+
+        def build():
+            labels, codes = np.unique(self.columns[label], return_inverse=True)
+            return labels, codes.ravel()
+        return self._memo(('label_codes', risktype), build)
@@ -0,0 +1,275 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+def rolling_stats(values, ndays):
+    """ Trailing `ndays` rolling sum and mean for every observation.
+
+    The window grows from the first observation until it holds `ndays`
+    values; missing values are skipped. Index is kept for Series input.
+    """
+    if not isinstance(values, pd.Series):
+        values = pd.Series(np.asarray(values, dtype=float))
+    rolling = values.rolling(ndays, min_periods=1)
+    return pd.DataFrame({'pcpt': rolling.sum(), 'mean': rolling.mean()}, columns=['pcpt', 'mean'])
+
+
+def calc_rolling_mean(array, ndays, location=None):
+    """ Rolling precipitation total and mean over `ndays` for one location.
+
+    `array` is a DataFrame with one column per location, or a Series/array
+    of observations when `location` is omitted.
+    """
+    values = array if location is None else array[location]
+    stats = rolling_stats(values, ndays)
+    return {'pcpt': stats['pcpt'], 'mean': stats['mean']}
+
+
+class RollingWindow(object):
+    """ O(1)-per-observation rolling sum and mean for appended observations. """
+
+    def __init__(self, ndays, values=()):
+        self.ndays = ndays
+        self.window = deque(maxlen=ndays)
+        self.total = 0.0
+        self.count = 0
+        self.extend(values)
+
+    def append(self, value):
+        """ Add one observation and return the (sum, mean) of the window. """
+        if len(self.window) == self.ndays:
+            self._drop(self.window[0])
+        self.window.append(value)
+        if not math.isnan(value):
+            self.total += value
+            self.count += 1
+        return self.sum, self.mean
+
+    def extend(self, values):
+        """ Add several observations, returning the rolling sums and means after each. """
+        results = [self.append(float(value)) for value in values]
+        sums = np.array([result[0] for result in results], dtype=float)
+        means = np.array([result[1] for result in results], dtype=float)
+        return sums, means
+
+    def _drop(self, value):
+        if not math.isnan(value):
+            self.total -= value
+            self.count -= 1
+
+    @property
+    def sum(self):
+        return self.total if self.count else float('nan')
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+
+# Daily series per community, stored as one directory per variable holding
+# float32 (communities, chunk_days) .npy chunks along time. A range query
+# memory-maps only the chunks it touches and reads one row from each.
+chunk_days = 4096
+frequencies = {'D': None, 'M': 'datetime64[M]', 'A': 'datetime64[Y]'}
+
+
+def write_timeseries(directory, frames, how=None, chunk_days=chunk_days):
+    """ Write {variable: DataFrame of daily values, dates x communities} to `directory`.
+
+    `how` maps variables to 'sum' or 'mean', the aggregation used for
+    monthly and annual values (default 'mean'). The store is written to a
+    temporary directory and swapped in with two renames, so readers never see
+    a partly written store, only a moment with none at all.
+    """
+    how = how or {}
+    communities = sorted(set().union(*(frame.columns for frame in frames.values())))
+    start = min(frame.index.min() for frame in frames.values())
+    end = max(frame.index.max() for frame in frames.values())
+    days = pd.date_range(start, end, freq='D')
+    parent = os.path.dirname(os.path.abspath(directory))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.timeseries-')
+    for variable, frame in frames.items():
+        values = frame.reindex(index=days, columns=communities).values.T.astype(np.float32)
+        os.makedirs(os.path.join(tmp, variable))
+        for k, offset in enumerate(range(0, len(days), chunk_days)):
+            np.save(os.path.join(tmp, variable, '%d.npy' % k), np.ascontiguousarray(values[:, offset:offset + chunk_days]))
+    with open(os.path.join(tmp, 'timeseries.json'), 'w') as f:
+        json.dump({
+            'communities': communities,
+            'start': str(days[0].date()),
+            'days': len(days),
+            'chunk_days': chunk_days,
+            'variables': {variable: how.get(variable, 'mean') for variable in frames}
+        }, f)
+    os.chmod(tmp, 0o755)
+    if os.path.isdir(directory):
+        old = tmp + '.old'
+        os.rename(directory, old)
+        os.rename(tmp, directory)
+        # Stores already open keep their mappings of the old chunks
+        shutil.rmtree(old)
+    else:
+        os.rename(tmp, directory)
+
+
+def import_csv(path, directory, sums=(), chunk_days=chunk_days):
+    """ Build a store from a long CSV with `community`, `date` and one column per variable. """
+    observations = pd.read_csv(path, parse_dates=['date'])
+    variables = [column for column in observations.columns if column not in ('community', 'date')]
+    frames = {
+        variable: observations.pivot(index='date', columns='community', values=variable)
+        for variable in variables
+    }
+    write_timeseries(directory, frames, {variable: 'sum' for variable in sums}, chunk_days)
+    return variables
+
+
+def aggregate(dates, values, freq, how='mean'):
+    """ Monthly ('M') or annual ('A') sums or means of a daily series, skipping missing days.
+
+    Returns the first day of each period and its value; periods with no
+    observations are NaN.
+    """
+    if frequencies[freq] is None or not len(dates):
+        return dates, values
+    periods = dates.astype(frequencies[freq])
+    starts = np.flatnonzero(np.concatenate([[True], periods[1:] != periods[:-1]]))
+    valid = ~np.isnan(values)
+    totals = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    counts = np.add.reduceat(valid.astype(int), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = totals if how == 'sum' else totals / counts
+    result = np.where(counts > 0, result, np.nan)
+    return periods[starts].astype('datetime64[D]'), result
+
+
+def lttb(x, y, threshold):
+    """ Positions of `threshold` points chosen by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last point and, from each bucket in between, the
+    point forming the largest triangle with the previous pick and the next
+    bucket's average, so peaks survive downsampling.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    # Average point of every bucket, and of the last point as the final "next bucket"
+    sizes = np.diff(np.append(edges, n))
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes[:-1], x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes[:-1], y[-1])
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+class TimeSeriesStore(object):
+    """ Memory-mapped daily climate series keyed by community and variable.
+
+    Every chunk is mapped when the store opens, so an import that replaces
+    the directory later cannot mix new chunks into an old manifest; the
+    store keeps serving the version it opened until it is reopened.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'timeseries.json')) as f:
+            manifest = json.load(f)
+        self.communities = manifest['communities']
+        self.index = {name: i for i, name in enumerate(self.communities)}
+        self.start = np.datetime64(manifest['start'], 'D')
+        self.days = manifest['days']
+        self.chunk_days = manifest['chunk_days']
+        self.variables = manifest['variables']
+        self._chunks = {
+            (variable, k): np.load(os.path.join(directory, variable, '%d.npy' % k), mmap_mode='r')
+            for variable in self.variables
+            for k in range(-(-self.days // self.chunk_days))
+        }
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def _chunk(self, variable, k):
+        return self._chunks[(variable, k)]
+
+    def _day(self, date, default):
+        if date is None:
+            return default
+        return int((np.datetime64(date, 'D') - self.start).astype(int))
+
+    def daily(self, community, variable, start=None, end=None):
+        """ Dates and values from `start` to `end` inclusive (default: the whole record). """
+        if variable not in self.variables:
+            raise KeyError('Unknown variable {!r}'.format(variable))
+        row = self.index[community]
+        first = max(self._day(start, 0), 0)
+        last = min(self._day(end, self.days - 1) + 1, self.days)
+        size = self.chunk_days
+        pieces = [
+            self._chunk(variable, k)[row, max(first - k * size, 0):last - k * size]
+            for k in range(first // size, (last - 1) // size + 1)
+        ] if last > first else []
+        values = np.concatenate(pieces).astype(float) if pieces else np.array([], dtype=float)
+        return self.start + np.arange(first, first + len(values)), values
+
+    def series(self, community, variable, start=None, end=None, freq='D', max_points=None):
+        """ A range of one series, aggregated to `freq` and LTTB-downsampled to at most `max_points`. """
+        dates, values = self.daily(community, variable, start, end)
+        dates, values = aggregate(dates, values, freq, self.variables[variable])
+        present = ~np.isnan(values)
+        dates, values = dates[present], values[present]
+        if max_points and len(values) > max_points:
+            keep = lttb(dates.astype(np.int64), values, max_points)
+            dates, values = dates[keep], values[keep]
+        return dates, values
+
+
+class LatestStore(object):
+    """ The TimeSeriesStore in `directory`, reopened once a new import replaces it.
+
+    Uses the same (mtime, size) check of the manifest as DatasetManager, so
+    `python cli.py timeseries` takes effect without restarting workers.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stat = self._manifest_stat()
+        self.store = TimeSeriesStore(directory)
+
+    def _manifest_stat(self):
+        stat = os.stat(os.path.join(self.directory, 'timeseries.json'))
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def current(self):
+        try:
+            stat = self._manifest_stat()
+        except OSError:
+            # Between the two renames of an import
+            return self.store
+        if stat != self._stat:
+            with self._lock:
+                if stat != self._stat:
+                    self.store = TimeSeriesStore(self.directory)
+                    self._stat = stat
+        return self.store